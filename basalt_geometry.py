@@ -0,0 +1,59 @@
+import os
+from build_profile import stage
+from build_cache import sources_key, cache_path, cached_json, write_atomically
+from geometry_prep import line_coordinates, prepare_geometry
+from lazy_imports import lazy_module
+
+gpd = lazy_module('geopandas')
+shapely = lazy_module('shapely')
+
+# basalt storage polygons drawn over the geostorage map
+basalt_zip_path = 'data/Geostorage/Basalt.zip'
+basalt_path = f'{basalt_zip_path}!/Basalt/basalt.shp'
+
+# code the cached basalt geometry is built with, part of its cache key
+builder_modules = [__file__, 'geometry_prep.py']
+
+def load_basalt_gdf():
+    """
+    Returns the basalt polygons reprojected to WGS84
+
+    The reprojection only runs when Basalt.zip or this code changes, the result is cached as GeoParquet
+    """
+    path = cache_path('basalt', sources_key([basalt_zip_path, *builder_modules]), 'parquet')
+    if os.path.exists(path):
+        return gpd.read_parquet(path)
+
+    with stage('ingest'):
+        basalt_gdf = gpd.read_file(basalt_path)
+    basalt_gdf = basalt_gdf.to_crs('WGS84')
+    write_atomically(path, basalt_gdf.to_parquet)
+    return basalt_gdf
+
+def basalt_outlines(basalt_gdf):
+    """
+    Takes the basalt polygons and returns the exterior ring of every part as lon and lat lists
+
+    Rings are separated by None so they can all be drawn by one Scattergeo trace
+    """
+    # split into several polygons and take their exteriors, all as array operations
+    polygons = shapely.get_parts(basalt_gdf.geometry.to_numpy())
+    return line_coordinates(shapely.get_exterior_ring(polygons))
+
+def build_basalt(tolerance=None, decimals=None):
+    """
+    Simplifies and rounds the basalt polygons and returns a dict of their geojson and outline lon/lat lists
+    """
+    basalt_gdf = load_basalt_gdf()
+    geojson = prepare_geometry(basalt_gdf[['geometry']], tolerance, decimals)
+    # outlines come from the same simplified polygons as the geojson
+    basalt_gdf = gpd.GeoDataFrame.from_features(geojson, crs=basalt_gdf.crs)
+    lons, lats = basalt_outlines(basalt_gdf)
+    return {'geojson': geojson, 'lon': lons, 'lat': lats}
+
+def load_basalt(tolerance=None, decimals=None):
+    """
+    Returns the basalt geojson and outlines for the given geometry settings, cached until Basalt.zip or the code building it changes
+    """
+    path = cache_path('basalt', sources_key([basalt_zip_path, *builder_modules], tolerance, decimals), 'json')
+    return cached_json(path, lambda: build_basalt(tolerance, decimals))
@@ -0,0 +1,79 @@
+import os
+import build_cache
+from build_cache import cached_json, sources_key
+from build_profile import stage
+from county_geometry import counties_zip_path, load_counties_gdf
+from geometry_prep import prepare_geometry, simplify_geometry
+
+# Plotly draws the land, state borders and coastlines under a geo map from a topojson file named after the map's
+# scope and resolution, usa_110m.json for every chapter map, which plotly.js downloads from the plotly cdn when
+# the map is drawn. Static exports run without network, so the file is built here from the bundled census
+# counties instead: the states are the counties dissolved by state and the land is all of them together.
+# It has no lakes, rivers or ocean, those layers are left empty
+
+# the file plotly asks for, and the geometry it is built from
+topojson_name = 'usa_110m'
+base_map_settings = {'resolution': '20m', 'tolerance': 0.01, 'decimals': 3}
+
+# plotly draws every edge as a great circle, so long straight borders like the 49th parallel are split into
+# edges of at most this many degrees to keep them on their parallel
+max_edge_degrees = 0.5
+
+# every layer plotly may read from the file, whether or not a map shows it
+base_map_layers = ['land', 'ocean', 'lakes', 'rivers', 'coastlines', 'countries', 'subunits']
+
+def topology(objects):
+    """
+    Takes a dict of object name to a list of geojson Polygon and MultiPolygon geometries and returns them as one
+    TopoJSON topology
+
+    Every ring becomes its own arc, nothing is shared or quantized. Plotly reads that as it is
+    """
+    arcs = []
+
+    def ring_arcs(ring):
+        arcs.append(ring)
+        return [len(arcs) - 1]
+
+    def topo_geometry(geometry):
+        if geometry['type'] == 'Polygon':
+            return {'type': 'Polygon', 'arcs': [ring_arcs(ring) for ring in geometry['coordinates']]}
+        return {'type': 'MultiPolygon',
+                'arcs': [[ring_arcs(ring) for ring in polygon] for polygon in geometry['coordinates']]}
+
+    topo_objects = {name: {'type': 'GeometryCollection', 'geometries': [topo_geometry(g) for g in geometries]}
+                    for name, geometries in objects.items()}
+    return {'type': 'Topology', 'objects': topo_objects, 'arcs': arcs}
+
+def build_base_topojson(resolution='20m', tolerance=None, decimals=None):
+    """
+    Builds the usa base map topology from the bundled county shapefile, with the states as subunits and their
+    union as land and coastlines
+    """
+    census_gdf = load_counties_gdf(resolution)
+    with stage('dissolve') as s:
+        states_gdf = s.rows(census_gdf[['STATEFP', 'geometry']].dissolve(by='STATEFP'))
+    if tolerance:
+        states_gdf = simplify_geometry(states_gdf, tolerance)
+    states_gdf.geometry = states_gdf.geometry.segmentize(max_edge_degrees)
+    # the land is dissolved from the simplified states so their borders line up
+    with stage('dissolve'):
+        land_gdf = states_gdf.dissolve()
+    states = [feature['geometry'] for feature in prepare_geometry(states_gdf, decimals=decimals)['features']]
+    land = [feature['geometry'] for feature in prepare_geometry(land_gdf, decimals=decimals)['features']]
+    objects = {name: [] for name in base_map_layers}
+    objects.update(land=land, coastlines=land, subunits=states)
+    return topology(objects)
+
+def load_base_map(resolution='20m', tolerance=None, decimals=None):
+    """
+    Returns the folder holding the base map topojson as topojson_name.json, building it the first time
+
+    The folder is keyed by the shapefile hash and the settings, so it can be handed to plotly as its topojson url
+    """
+    zip_path = counties_zip_path.format(resolution=resolution)
+    # looked up when called, so a benchmark can point the cache somewhere else
+    folder = os.path.join(build_cache.cache_dir, 'topojson', sources_key([zip_path, __file__], resolution, tolerance, decimals))
+    os.makedirs(folder, exist_ok=True)
+    cached_json(os.path.join(folder, f'{topojson_name}.json'), lambda: build_base_topojson(resolution, tolerance, decimals))
+    return folder
@@ -0,0 +1,147 @@
+import argparse
+import glob
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+import build_cache
+from build_all import build_map, map_modules
+from build_context import BuildContext
+
+# Times every stage of every map build (ingest, join, dissolve, geojson, figure, serialize, write) and records
+# the size of the written files and the peak memory, then compares them with a stored baseline.
+# Run with --save-baseline once to store the numbers a later run is checked against
+
+baseline_path = 'benchmarks/baseline.json'
+# a stage or map only counts as slower when it is both this much slower and at least min_seconds slower,
+# so timer noise on the quick stages doesn't fail the run
+tolerance = 0.2
+min_seconds = 0.05
+
+@contextmanager
+def empty_cache():
+    """
+    Points build_cache at a new empty cache folder for the with block, then deletes it and restores the real one
+
+    The source file hashes are kept in the cache folder too, so they are forgotten and re-hashed as well
+    """
+    saved = build_cache.cache_dir, build_cache.source_hashes_path, build_cache._source_hashes
+    build_cache.cache_dir = tempfile.mkdtemp(prefix='cache_')
+    build_cache.source_hashes_path = f'{build_cache.cache_dir}/source_hashes.json'
+    build_cache._source_hashes = None
+    try:
+        yield
+    finally:
+        shutil.rmtree(build_cache.cache_dir, ignore_errors=True)
+        build_cache.cache_dir, build_cache.source_hashes_path, build_cache._source_hashes = saved
+
+def benchmark_map(name, output_dir, cold=False, trace_memory=False):
+    """
+    Builds one map into output_dir and returns its stage seconds, total seconds, output bytes and peak memory
+
+    With cold the map is built with an empty cache, so the parsing, dissolving and geojson steps that are
+    normally cached are timed as well. Peak memory is only measured with trace_memory, tracemalloc slows
+    the build down
+    """
+    with empty_cache() if cold else nullcontext():
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            report = build_map(name, BuildContext(output_dir=output_dir, plotlyjs='cdn'))
+            peak = tracemalloc.get_traced_memory()[1] / 1e6 if trace_memory else None
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+
+    output_name = importlib.import_module(name).output_name
+    output_bytes = sum(os.path.getsize(path) for path in glob.glob(os.path.join(output_dir, f'{output_name}*')))
+    return {'seconds': report['seconds'],
+            'stages': {stage: record['wall'] for stage, record in report['stages'].items()},
+            'output_bytes': output_bytes,
+            'peak_mb': peak}
+
+def best_of(runs):
+    """
+    Takes several results for one map and keeps the fastest time of each stage, and the one peak memory measured.
+    Sizes don't change between runs
+    """
+    # the run that traced memory is only timed when it is the only run
+    timed = [run for run in runs if run['peak_mb'] is None] or runs
+    result = dict(runs[0])
+    result['seconds'] = min(run['seconds'] for run in timed)
+    stages = {stage for run in timed for stage in run['stages']}
+    result['stages'] = {stage: min(run['stages'].get(stage, 0.0) for run in timed) for stage in sorted(stages)}
+    result['peak_mb'] = max(run['peak_mb'] or 0.0 for run in runs)
+    return result
+
+def compare(results, baseline):
+    """
+    Returns a list of messages for every map, stage, output size or peak memory that got worse than the baseline
+    """
+    regressions = []
+
+    def check(label, value, base, floor):
+        if base is not None and value > base * (1 + tolerance) and value - base > floor:
+            regressions.append(f'{label}: {base:,.2f} -> {value:,.2f}')
+
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        check(f'{name} seconds', result['seconds'], base['seconds'], min_seconds)
+        for stage, seconds in result['stages'].items():
+            check(f'{name} {stage} seconds', seconds, base['stages'].get(stage), min_seconds)
+        check(f'{name} output bytes', result['output_bytes'], base['output_bytes'], 0)
+        check(f'{name} peak MB', result['peak_mb'], base['peak_mb'], 1)
+    return regressions
+
+def print_results(results):
+    stages = sorted({stage for result in results.values() for stage in result['stages']})
+    print(f'{"map":<16}' + ''.join(f'{stage:>11}' for stage in stages) + f'{"total s":>11}{"output MB":>11}{"peak MB":>11}')
+    for name, result in results.items():
+        print(f'{name:<16}' + ''.join(f'{result["stages"].get(stage, 0.0):>11.3f}' for stage in stages) +
+              f'{result["seconds"]:>11.3f}{result["output_bytes"] / 1e6:>11.2f}{result["peak_mb"]:>11.1f}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every stage of every chapter map build')
+    parser.add_argument('maps', nargs='*', help=f'only benchmark these maps, any of: {", ".join(map_modules)}')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='build each map this many times and keep the fastest. The first build measures memory and is not timed')
+    parser.add_argument('--cold', action='store_true', help='build every map with an empty cache')
+    parser.add_argument('--save-baseline', action='store_true', help=f'store the results in {baseline_path}')
+    args = parser.parse_args()
+    unknown = set(args.maps) - set(map_modules)
+    if unknown:
+        parser.error(f'unknown maps: {", ".join(sorted(unknown))}')
+
+    results = {}
+    output_dir = tempfile.mkdtemp(prefix='chapter_maps_')
+    try:
+        for name in args.maps or map_modules:
+            results[name] = best_of([benchmark_map(name, output_dir, args.cold, trace_memory=i == 0) for i in range(args.repeat)])
+    finally:
+        shutil.rmtree(output_dir)
+    print_results(results)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print(f'Saved baseline to {baseline_path}')
+        return
+
+    if not os.path.exists(baseline_path):
+        print(f'No baseline at {baseline_path}, run with --save-baseline to store one')
+        return
+    with open(baseline_path) as f:
+        regressions = compare(results, json.load(f))
+    for message in regressions:
+        print(f'Regression: {message}')
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -1,78 +1,118 @@
-from heapq import merge
-from wsgiref.util import shift_path_info
-from requests import get
-import json
-import pandas as pd
-import geopandas as gpd
-import numpy as np
-import math
-import seaborn as sns
-import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from dash import Dash, dcc, html, Input, Output
-import os
+from build_context import BuildContext
+from dataset_catalog import read_dataset
+from figure_variants import colorbar_off_layout, view_menu
 
 # folder holding all forestry cdr data
 bicrs_path = 'data/BiCRS CDR'
 
-# data from census linking county name and fips
-county_fips_df = pd.read_csv('data/label_geography.csv', dtype={'geography':'str'})
-county_fips_df = county_fips_df[county_fips_df['geo_level']=='C']
-county_fips_df = county_fips_df.rename(columns={'label':'County, State', 'geography':'FIPS'})
-county_fips_df['GEO_ID'] = '0500000US' + county_fips_df['FIPS']
+# name of the html file written to chapter_maps
+output_name = 'bicrs_map'
 
-# map county names to regions
-regions_df = pd.read_excel('data/Regions and SVI.xlsx', sheet_name='County_Region_Mapping', dtype={'FIPS': str, 'GEOID':str})
-regions_df['GEOID'] = regions_df['GEOID'].apply(lambda x: str(x).zfill(5))
-regions_df['FIPS'] = regions_df['FIPS'].apply(lambda x: str(x).zfill(5))
+# simplification and rounding of the dissolved region polygons, see geometry_prep
+region_geometry_settings = {'resolution': '20m', 'tolerance': 0.01, 'decimals': 3}
 
-# read bicrs data
-bicrs_wet_df = pd.read_excel(f'{bicrs_path}/20231205 Regional Summary.xlsx', sheet_name='Regional cost and CDR Wet only')
-bicrs_dry_df = pd.read_excel(f'{bicrs_path}/20231205 Regional Summary.xlsx', sheet_name='Regional cost CDR Dry only')
-bicrs_both_df = pd.read_excel(f'{bicrs_path}/20231205 Regional Summary.xlsx', sheet_name='Regional cost and CDR Wet + Dry')
-bicrs_transport_df = pd.read_excel(f'{bicrs_path}/20231205 Regional Summary.xlsx', sheet_name='CO2 by transport mode')
+# files this map is built from. The map is only rebuilt when one of these, or the code, changes
+inputs = ['data/BiCRS CDR/20231205 Regional Summary.xlsx',
+          'data/Regions and SVI.xlsx',
+          'data/cb_2018_us_county_20m.zip']
+
+# region totals, given once per region on one of its rows
+cdr_col = 'Sum CO2 Removal Potential (Million tonnes CO2/year)'
+cost_col = 'Average  regional cost ($/tonne CO2)'
 
 # merge cdr dfs with region dfs
 def process_bicrs(df):
     """
     Processes Bicrs Region Dfs
 
-    Drops empty rows and fills other values forward
+    Drops empty rows and fills the technology columns forward. The region totals are left on the one row of each
+    region that carries them, filling them forward would copy them onto the next region's first rows
     """
-    df = df.dropna(how='all')
-    return df.ffill()
+    df = df.dropna(how='all').copy()
+    fill_cols = [col for col in df.columns if col not in (cdr_col, cost_col)]
+    df[fill_cols] = df[fill_cols].ffill()
+    return df
 
-# Process all dfs
-bicrs_wet_df = process_bicrs(bicrs_wet_df)
-bicrs_dry_df = process_bicrs(bicrs_dry_df)
-bicrs_both_df = process_bicrs(bicrs_both_df)
+def load_bicrs():
+    """
+    Reads the regional BiCRS summary sheets and returns the wet, dry, wet + dry and transport dfs
+    """
+    # read bicrs data. The workbook is only parsed once for all four sheets
+    bicrs_wet_df = read_dataset(f'{bicrs_path}/20231205 Regional Summary.xlsx', sheet_name='Regional cost and CDR Wet only')
+    bicrs_dry_df = read_dataset(f'{bicrs_path}/20231205 Regional Summary.xlsx', sheet_name='Regional cost CDR Dry only')
+    bicrs_both_df = read_dataset(f'{bicrs_path}/20231205 Regional Summary.xlsx', sheet_name='Regional cost and CDR Wet + Dry')
+    bicrs_transport_df = read_dataset(f'{bicrs_path}/20231205 Regional Summary.xlsx', sheet_name='CO2 by transport mode')
+
+    # Process all dfs
+    bicrs_wet_df = process_bicrs(bicrs_wet_df)
+    bicrs_dry_df = process_bicrs(bicrs_dry_df)
+    bicrs_both_df = process_bicrs(bicrs_both_df)
+    return bicrs_wet_df, bicrs_dry_df, bicrs_both_df, bicrs_transport_df
+
+# biomass scenarios the map can switch between. The first is the one drawn by make_figure
+scenario_labels = ['Total Biomass', 'Wet Biomass Waste', 'Low Moisture Biomass']
+
+def region_totals(df):
+    """
+    Takes a processed region sheet and returns the row of each region that carries its CDR and cost totals
+    """
+    totals_df = df.dropna(subset=[cdr_col])
+    missing = set(df['Region']) - set(totals_df['Region'])
+    repeated = totals_df.loc[totals_df['Region'].duplicated(), 'Region']
+    if missing or len(repeated):
+        raise ValueError(f'regions without exactly one total row: {", ".join(sorted(missing | set(repeated)))}')
+    return totals_df
+
+def scenario_frames(bicrs_wet_df, bicrs_dry_df, bicrs_both_df):
+    """
+    Returns a dict of scenario label to its df, all with one row per region in the same region order
 
-# read file taken from census. This should have Oglala 
-counties_path = 'data/cb_2018_us_county_20m.zip!cb_2018_us_county_20m.shp'
-census_gdf = gpd.read_file(counties_path)
+    Switching scenarios then only has to swap z and customdata, the trace locations stay the same
+    """
+    frames = dict(zip(scenario_labels, [bicrs_both_df, bicrs_wet_df, bicrs_dry_df]))
+    # one row per region, in the order of the total biomass sheet
+    regions = bicrs_both_df['Region'].drop_duplicates()
+    for label, df in frames.items():
+        df = region_totals(df).set_index('Region')
+        df = df.reindex(regions).reset_index()
+        frames[label] = df
+    return frames
+
+def scenario_view(df):
+    """
+    Takes a scenario df and returns the z and customdata of the choropleth for it
+    """
+    return {'z': df[cdr_col].tolist(),
+            'customdata': df[['Region', cost_col]].values.tolist()}
 
-# merge them together
-census_gdf = census_gdf.merge(regions_df, left_on='GEOID', right_on='FIPS')
+def scenario_views(frames):
+    """
+    Takes the scenario dfs and returns them as views, new z and customdata for the choropleth
+    """
+    return {label: {'data': {0: scenario_view(df)}} for label, df in frames.items()}
 
-# combine regions into one polygon
-regions_gdf = census_gdf[['Region', 'geometry']].dissolve(by='Region')
+def views(context):
+    """
+    Returns the scenarios the map app can switch between
+    """
+    bicrs_wet_df, bicrs_dry_df, bicrs_both_df, bicrs_transport_df = load_bicrs()
+    return scenario_views(scenario_frames(bicrs_wet_df, bicrs_dry_df, bicrs_both_df))
 
-def make_choro_trace(df, color_scale):
+def make_choro_trace(df, regions_geojson, color_scale):
     """
     Takes a df and returns a plotly GO choropleth object
     """
-    print(df.columns)
     trace = go.Choropleth(
-                        geojson=json.loads(regions_gdf.geometry.to_json()),
+                        geojson=regions_geojson,
                         locationmode="geojson-id",
                         locations=df['Region'],
                         # featureidkey='properties.GEO_ID',
-                        z=df['Sum CO2 Removal Potential (Million tonnes CO2/year)'],
+                        z=df[cdr_col],
                         zauto=True,
                         coloraxis='coloraxis',
                         # colorscale=color_scale,
-                        customdata=df[['Region', 'Average  regional cost ($/tonne CO2)']],
+                        customdata=df[['Region', cost_col]],
                         hovertemplate=  '<b>Region</b>: %{customdata[0]}<br>' +
                                         '<b>Regional CDR Potential</b>: %{z:,.0f} Million Tonnes CO<sub>2</sub> per Year<br>' +
                                         '<b>Regional CDR Average Cost</b>: $%{customdata[1]:,.0f} per Tonne CO<sub>2</sub><br>' +
@@ -85,95 +125,42 @@ def make_bar_trace(df):
     """
     df = df.sort_values(by=['Sum CO2 Removal Potential (Million tonnes CO2/year)', 'CO2 Removal Potential (tonne CO2/year)'], ascending=[False, False])
 
-fig = go.Figure(make_choro_trace(bicrs_both_df, 'Viridis'))
-fig.update_geos(scope='usa')
-fig.update_layout(coloraxis_colorscale='Viridis')
-
-"""
-# Add locations bar chart
-fig.add_trace(
-    go.Bar(x=freq["x"][0:10],y=freq["Country"][0:10], marker=dict(color="crimson"), showlegend=False),
-    row=1, col=2
-)
-"""
-
-"""
-# create buttons to filter between wet and dry
-fig.update_layout(
-    updatemenus=[
-        dict(
-            type="dropdown",
-            direction="down",
-            pad={"r": 10, "t": 10},
-            showactive=True,
-            x=0.5,
-            xanchor="center",
-            y=1.1,
-            yanchor="top",
-            buttons=[
-                        dict(
-                            label="Total Biomass",
-                            method="update",
-                            args=[{"z": [bicrs_both_df['Sum CO2 Removal Potential (Million tonnes CO2/year)']],
-                                'locations': [bicrs_both_df['Region']],
-                                    'customdata': [bicrs_both_df[['Region', 'Average  regional cost ($/tonne CO2)']].values.tolist()]
-                                    },
-                                    {"coloraxis.colorscale": 'Viridis' #[[0, '#EBD985'], [1, '#7DB28C']]
-                                }],
-                            ),
-                        dict(
-                            label="Wet Biomass Waste",
-                            method="update",
-                            args=[{"z": [bicrs_wet_df['Sum CO2 Removal Potential (Million tonnes CO2/year)']],
-                                'locations': [bicrs_wet_df['Region']],
-                                'customdata': [bicrs_wet_df[['Region', 'Average  regional cost ($/tonne CO2)']].values.tolist()]
-                                    },
-                                {"coloraxis.colorscale": 'Viridis' #[[0, '#FFFFFF'], [1, '#906E92']]
-                                }],
-                        ),
-                        dict(
-                            label="Low Moisture Biomass",
-                            method="update",
-                            args=[{"z": [bicrs_dry_df['Sum CO2 Removal Potential (Million tonnes CO2/year)']],
-                                'locations': [bicrs_dry_df['Region']],
-                                    'customdata': [bicrs_dry_df[['Region', 'Average  regional cost ($/tonne CO2)']].values.tolist()]
-                                    },
-                                    {"coloraxis.colorscale": 'Viridis' #[[0, '#EBD985'], [1, '#7DB28C']]
-                                }],
-                            ),
-
-                    ] 
-                )
-            ],
-        coloraxis={'colorbar': {'title':'Annual Carbon Removal<br>Potential in 2050 (MMT)',
-                                "x": 0.50, 
-                                "len": 0.75, 
-                                "y": -0.3,
-                                'orientation':'h',
-                                'titlefont':{'size':10},
-                                'tickfont':{'size':10}
-                                }
-                   },
-        # title={
-        # 'text': "Zero cropland change biomass<br>optimal use of 90% of total biomass supply to minimize cost per tonne CO<sub>2</sub>e",
-        # 'y':1,
-        # 'x':0.5,
-        # 'font':{'size':10},
-        # 'xanchor': 'center',
-        # 'yanchor': 'top',
-        # 'yref': 'paper'
-        # }   
-        )
-"""
-
-fig.update_coloraxes(colorbar_title_side='top')
-fig.write_html('chapter_maps/bicrs_map.html', auto_play=False)
-# save version with no cbar
-for i in range(len(fig.data)):
-    fig.update_layout({f'coloraxis{i+1}':{'showscale':False}})
-    
-fig.show()
-fig.write_html('chapter_maps/bicrs_map_nocbar.html', auto_play=False)
+def make_figure(context):
+    """
+    Builds the BiCRS chapter map
+    """
+    bicrs_wet_df, bicrs_dry_df, bicrs_both_df, bicrs_transport_df = load_bicrs()
+    # one polygon per region, dissolved from the counties once and cached
+    regions_geojson = context.regions(**region_geometry_settings)
+
+    frames = scenario_frames(bicrs_wet_df, bicrs_dry_df, bicrs_both_df)
+    fig = go.Figure(make_choro_trace(frames[scenario_labels[0]], regions_geojson, 'Viridis'))
+    fig.update_geos(scope='usa')
+    fig.update_layout(coloraxis_colorscale='Viridis')
 
+    """
+    # Add locations bar chart
+    fig.add_trace(
+        go.Bar(x=freq["x"][0:10],y=freq["Country"][0:10], marker=dict(color="crimson"), showlegend=False),
+        row=1, col=2
+    )
+    """
+
+    # dropdown to switch between total, wet and dry biomass. Only the z and customdata arrays differ
+    fig.update_layout(updatemenus=[view_menu(scenario_views(frames))])
 
+    fig.update_coloraxes(colorbar_title_side='top')
+    return fig
 
+def build(context):
+    """
+    Writes the BiCRS map and its no color bar version to the output folder
+    """
+    fig = make_figure(context)
+    # save version with no cbar. Only the layout differs, so it shares the figure data with the main map
+    context.write_map(fig, output_name, variants={'nocbar': colorbar_off_layout(fig)})
+    return fig
+
+if __name__ == '__main__':
+    fig = build(BuildContext())
+    fig.show()
@@ -0,0 +1,185 @@
+import argparse
+import importlib
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from build_context import BuildContext
+from build_profile import recording, write_report
+from county_facts import fact_modules, write_county_facts
+from figure_variants import variant_files
+from network_layers import network_layers
+from build_stamps import map_stamp, is_up_to_date, write_stamp
+
+# map scripts in the order they appear in index.html
+map_modules = ['forestry_map',
+               'soils_map_v2',
+               'bicrs_map',
+               'geostorage_map',
+               'dac_map',
+               'eeej_map',
+               'region_map']
+
+# context shared by every map built in a worker process. Set once per worker by _init_worker
+_worker_context = None
+
+def _init_worker(context):
+    global _worker_context
+    _worker_context = context
+
+def output_bytes(context, module):
+    """
+    Returns the total size of the html pages and figure data a map has written to the output folder, 0 if none
+    """
+    return sum(os.path.getsize(path) for path in variant_files(context.output_dir, module.output_name))
+
+def build_map(name, context=None, trace_memory=False, profile_stage=None):
+    """
+    Builds one map module and returns its report: the seconds it took, the cost of each stage (see build_profile)
+    and the size of its written files before and after the build
+
+    trace_memory records each stage's peak memory and profile_stage runs that stage under cProfile
+    """
+    module = importlib.import_module(name)
+    context = context or _worker_context
+    previous_bytes = output_bytes(context, module)
+    start = time.perf_counter()
+    with recording(trace_memory, profile_stage) as recorder:
+        # whatever the build does outside the named stages (ingest, join, write...) is figure construction
+        with context.stage('figure'):
+            module.build(context)
+    return {'seconds': time.perf_counter() - start,
+            'previous_output_bytes': previous_bytes,
+            'output_bytes': output_bytes(context, module),
+            **recorder.report()}
+
+def try_build_map(name, context=None, trace_memory=False, profile_stage=None):
+    """
+    Builds one map like build_map, but when the build fails returns a report with the error and its traceback
+    instead of raising, so one broken map doesn't stop the others from being built
+    """
+    start = time.perf_counter()
+    try:
+        return build_map(name, context, trace_memory, profile_stage)
+    except Exception as e:
+        return {'seconds': time.perf_counter() - start, 'error': f'{type(e).__name__}: {e}',
+                'traceback': traceback.format_exc()}
+
+def failed_maps(reports):
+    """
+    Returns the names of the maps whose build report has an error
+    """
+    return [name for name, report in reports.items() if 'error' in report]
+
+def outdated_maps(context, maps, force=False):
+    """
+    Returns a dict of map module to stamp for the maps whose inputs or code changed since their last build
+    """
+    stamps = {}
+    for name in maps:
+        module = importlib.import_module(name)
+        stamp = map_stamp(module, map_modules, context.settings())
+        if not force and is_up_to_date(context, module, stamp):
+            print(f'{name}: up to date')
+            continue
+        stamps[name] = stamp
+    return stamps
+
+def build_all(context=None, maps=None, force=False, workers=1, trace_memory=False, profile_stage=None,
+              report_dir='build_reports'):
+    """
+    Builds every chapter map, sharing one context so reference data and geometry are read once
+
+    Maps whose inputs and code are unchanged since their last build are skipped unless force is set.
+    With workers > 1 the maps are rendered in a process pool. The shared reference data is loaded once
+    up front and copied to each worker when it starts.
+    A map that fails is reported with its error and left unstamped, and the other maps are still built.
+    Returns a dict of map module to its build report, and writes them all to a json report in report_dir
+    """
+    context = context or BuildContext()
+    started = datetime.now()
+    stamps = outdated_maps(context, maps or map_modules, force)
+    reports = {}
+
+    def finished(name, report):
+        reports[name] = report
+        if 'error' in report:
+            print(f'{name}: failed after {report["seconds"]:.1f}s\n{report["traceback"]}')
+            return
+        write_stamp(context, importlib.import_module(name), stamps[name])
+        size = f'{report["output_bytes"] / 1e6:.2f} MB'
+        if report['previous_output_bytes']:
+            size = f'{report["previous_output_bytes"] / 1e6:.2f} MB -> {size}'
+        print(f'{name}: {report["seconds"]:.1f}s, {size}')
+
+    if workers <= 1:
+        for name in stamps:
+            finished(name, try_build_map(name, context, trace_memory, profile_stage))
+    else:
+        build_in_pool(context, stamps, workers, trace_memory, profile_stage, finished)
+
+    # the county fact table the maps were built from, for analysis outside the maps
+    if any(name in fact_modules for name in reports if name not in failed_maps(reports)):
+        print(f'County facts: {write_county_facts(context)}')
+
+    if report_dir and reports:
+        path = write_report(report_dir, {'started': started.isoformat(timespec='seconds'),
+                                         'seconds': (datetime.now() - started).total_seconds(),
+                                         'workers': workers,
+                                         'settings': context.settings(),
+                                         'maps': reports})
+        print(f'Build report: {path}')
+    return reports
+
+def build_in_pool(context, stamps, workers, trace_memory, profile_stage, finished):
+    """
+    Builds the maps in a process pool, calling finished(name, report) as each one completes or fails
+    """
+    # maps declare the county or region geometry they embed, so it can be prepared once before the workers start
+    modules = [importlib.import_module(name) for name in stamps]
+    context.warm([module.geometry_settings for module in modules if hasattr(module, 'geometry_settings')],
+                 [module.region_geometry_settings for module in modules if hasattr(module, 'region_geometry_settings')],
+                 facts=any(hasattr(module, 'fact_columns') for module in modules))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(context,)) as pool:
+        futures = {pool.submit(try_build_map, name, None, trace_memory, profile_stage): name for name in stamps}
+        for future in as_completed(futures):
+            try:
+                report = future.result()
+            except Exception as e:
+                # the worker itself died, e.g. ran out of memory
+                report = {'seconds': 0.0, 'error': f'{type(e).__name__}: {e}', 'traceback': traceback.format_exc()}
+            finished(futures[future], report)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build all chapter maps')
+    parser.add_argument('maps', nargs='*', help=f'only build these maps, any of: {", ".join(map_modules)}')
+    parser.add_argument('--output-dir', default='chapter_maps', help='folder the html files are written to')
+    parser.add_argument('--plotlyjs', choices=['local', 'cdn', 'inline'], default='local',
+                        help='write one shared plotly.min.js (local), load it from the cdn, or embed it in every map (inline)')
+    parser.add_argument('--force', action='store_true', help='rebuild maps even if their inputs have not changed')
+    parser.add_argument('--layers', nargs='+', choices=list(network_layers), default=[],
+                        help='draw these pipeline, road, waterway or transloading networks over every map')
+    parser.add_argument('--trace-memory', action='store_true', help='record the peak memory of every build stage')
+    parser.add_argument('--profile-stage', help='run this build stage (e.g. dissolve or serialize) under cProfile')
+    parser.add_argument('--report-dir', default='build_reports', help='folder the json build report is written to')
+    parser.add_argument('--workers', type=int, default=1, nargs='?', const=os.cpu_count(),
+                        help='render maps in parallel with this many processes. Defaults to one per cpu if no number is given')
+    args = parser.parse_args()
+    unknown = set(args.maps) - set(map_modules)
+    if unknown:
+        parser.error(f'unknown maps: {", ".join(sorted(unknown))}')
+
+    start = time.perf_counter()
+    reports = build_all(BuildContext(output_dir=args.output_dir, plotlyjs=args.plotlyjs, layers=args.layers), args.maps,
+                        force=args.force, workers=args.workers, trace_memory=args.trace_memory,
+                        profile_stage=args.profile_stage, report_dir=args.report_dir)
+    failed = failed_maps(reports)
+    print(f'Built {len(reports) - len(failed)} maps in {time.perf_counter() - start:.1f}s')
+    for name in failed:
+        print(f'Failed: {name}: {reports[name]["error"]}')
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
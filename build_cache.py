@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import pandas as pd
+
+# folder holding everything derived from the raw data. Safe to delete, it gets rebuilt on the next run
+cache_dir = 'cache'
+
+# hashes of source files, remembered alongside their mtime and size so unchanged files are not re-read
+source_hashes_path = f'{cache_dir}/source_hashes.json'
+_source_hashes = None
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    Takes a file path and returns the sha256 hex digest of its contents
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def source_hash(path):
+    """
+    Returns the sha256 of a source file, only re-hashing it when its mtime or size has changed
+    """
+    global _source_hashes
+    if _source_hashes is None:
+        _source_hashes = {}
+        if os.path.exists(source_hashes_path):
+            with open(source_hashes_path) as f:
+                _source_hashes = json.load(f)
+
+    stat = os.stat(path)
+    entry = _source_hashes.get(path)
+    if entry and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+        return entry['sha256']
+
+    entry = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': file_hash(path)}
+    _source_hashes[path] = entry
+    os.makedirs(cache_dir, exist_ok=True)
+    write_atomically(source_hashes_path, _write_json(_source_hashes))
+    return entry['sha256']
+
+def sources_key(paths, *extra):
+    """
+    Combines the hashes of several source files, plus any extra settings, into one short cache key
+    """
+    sha = hashlib.sha256()
+    for path in paths:
+        sha.update(source_hash(path).encode())
+    for value in extra:
+        sha.update(str(value).encode())
+    return sha.hexdigest()[:16]
+
+def write_atomically(path, write):
+    """
+    Calls write(tmp_path) then moves the result onto path, so parallel builds never see a half written cache file
+    """
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def _write_json(data):
+    def write(path):
+        with open(path, 'w') as f:
+            json.dump(data, f)
+    return write
+
+def cache_path(name, key, ext):
+    """
+    Returns the path of a cache file for name, keyed by key. Creates the cache folder if needed
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    return f'{cache_dir}/{name}_{key}.{ext}'
+
+def cached_json(path, loader):
+    """
+    Returns the json at path, calling loader() and saving its result there if it does not exist yet
+    """
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+
+    data = loader()
+    write_atomically(path, _write_json(data))
+    return data
+
+def cached_frame(name, sources, loader):
+    """
+    Returns the df made by loader(), stored as parquet keyed on the source files it was read from
+
+    loader is only called when one of the sources has changed since the last run
+    """
+    path = cache_path(name, sources_key(sources), 'parquet')
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+
+    df = loader()
+    write_atomically(path, df.to_parquet)
+    return df
@@ -0,0 +1,189 @@
+import os
+from functools import cached_property
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+from build_cache import source_hash, write_atomically
+from build_profile import stage
+from figure_variants import write_figure_variants
+from county_facts import load_county_facts
+from county_geometry import load_counties, load_counties_gdf
+from network_layers import add_network_layers, default_network_settings, load_network, network_layers
+from region_geometry import load_regions
+from reference_data import load_county_fips, load_region_mapping, load_region_colors
+
+class BuildContext:
+    """
+    Shared state for building chapter maps
+
+    Reference data and county geometry are loaded the first time a map asks for them, then reused by every
+    other map built with the same context
+    """
+    def __init__(self, output_dir='chapter_maps', plotlyjs='local', layers=()):
+        self.output_dir = output_dir
+        # how each map loads plotly.js. 'local' writes one plotly.min.js to the output folder that every map
+        # references by relative path, 'cdn' loads it from the plotly cdn and 'inline' embeds it in every file
+        self.plotlyjs = plotlyjs
+        # network layers from network_layers drawn over every map, e.g. ('pipelines',). Off by default
+        self.layers = tuple(layers)
+        self._plotlyjs_written = False
+        self._counties = {}
+        self._counties_gdf = {}
+        self._regions = {}
+        self._networks = {}
+
+    @cached_property
+    def county_fips(self):
+        """
+        County label df with county_code, FIPS, County, State, State and GEO_ID columns
+        """
+        return load_county_fips()
+
+    @cached_property
+    def region_mapping(self):
+        """
+        County to region mapping from Regions and SVI.xlsx
+        """
+        return load_region_mapping()
+
+    @cached_property
+    def region_colors(self):
+        """
+        Region colors from Regions and SVI.xlsx
+        """
+        return load_region_colors()
+
+    @cached_property
+    def county_facts(self):
+        """
+        One row per county with the metrics of every county level chapter map, see county_facts
+        """
+        return load_county_facts(self)
+
+    def counties(self, resolution='20m', **settings):
+        """
+        County FeatureCollection for the given resolution
+
+        settings are the geometry_prep tolerance, decimals and shared_arcs. Without them the geometry is left as is
+        """
+        key = (resolution, tuple(sorted(settings.items())))
+        if key not in self._counties:
+            self._counties[key] = load_counties(resolution, **settings)
+        return self._counties[key]
+
+    def counties_gdf(self, resolution='20m'):
+        """
+        County GeoDataFrame for the given resolution. Returns a copy so maps can merge into it freely
+        """
+        if resolution not in self._counties_gdf:
+            self._counties_gdf[resolution] = load_counties_gdf(resolution)
+        return self._counties_gdf[resolution].copy()
+
+    def regions(self, resolution='5m', **settings):
+        """
+        Region FeatureCollection with the region name as each feature id
+
+        settings are the geometry_prep tolerance, decimals and shared_arcs
+        """
+        key = (resolution, tuple(sorted(settings.items())))
+        if key not in self._regions:
+            self._regions[key] = load_regions(resolution, regions_df=self.region_mapping, **settings)
+        return self._regions[key]
+
+    def networks(self):
+        """
+        Dict of layer name to the loaded groups of every network layer this context draws
+        """
+        for name in self.layers:
+            if name not in self._networks:
+                self._networks[name] = load_network(name, **default_network_settings)
+        return {name: self._networks[name] for name in self.layers}
+
+    def settings(self):
+        """
+        Build options that change the written maps. Recorded in each map's stamp
+        """
+        settings = {'plotlyjs': self.plotlyjs}
+        if self.layers:
+            # the layer files are inputs of every map once they are drawn
+            settings['layers'] = {name: source_hash(network_layers[name]['path']) for name in self.layers}
+        return settings
+
+    def warm(self, geometry_settings=(), region_geometry_settings=(), facts=False):
+        """
+        Loads all the shared reference data up front, e.g. before the context is copied to worker processes
+
+        geometry_settings and region_geometry_settings are lists of settings dicts, including resolution, for the
+        county and region geometry to load. facts loads the county fact table too
+        """
+        self.county_fips
+        self.region_mapping
+        self.region_colors
+        if facts:
+            self.county_facts
+        for settings in geometry_settings:
+            self.counties(**settings)
+        for settings in region_geometry_settings:
+            self.regions(**settings)
+        self.networks()
+        return self
+
+    def stage(self, name):
+        """
+        Context manager that times a named build stage, see build_profile
+        """
+        return stage(name)
+
+    def output_path(self, name):
+        return os.path.join(self.output_dir, f'{name}.html')
+
+    def write_plotlyjs(self):
+        """
+        Writes plotly.min.js to the output folder, unless an identical copy is already there
+        """
+        path = os.path.join(self.output_dir, 'plotly.min.js')
+        os.makedirs(self.output_dir, exist_ok=True)
+        plotlyjs = get_plotlyjs()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                if f.read() == plotlyjs:
+                    return
+
+        def write(tmp_path):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(plotlyjs)
+        write_atomically(path, write)
+
+    def include_plotlyjs(self):
+        """
+        Returns the include_plotlyjs argument for write_html that matches the plotlyjs setting
+        """
+        if self.plotlyjs == 'inline':
+            return True
+        if self.plotlyjs == 'cdn':
+            return 'cdn'
+
+        if not self._plotlyjs_written:
+            self.write_plotlyjs()
+            self._plotlyjs_written = True
+        return 'plotly.min.js'
+
+    def plotlyjs_tag(self):
+        """
+        Returns the script tag that loads plotly.js, matching the plotlyjs setting
+        """
+        include = self.include_plotlyjs()
+        if include is True:
+            return f'<script type="text/javascript">{get_plotlyjs()}</script>'
+        if include == 'cdn':
+            include = f'https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js'
+        return f'<script type="text/javascript" src="{include}" charset="utf-8"></script>'
+
+    def write_map(self, fig, name, variants=None):
+        """
+        Writes fig's data once to name.figure.js, plus name.html and a small html file per layout variant
+
+        variants is a dict of file suffix to layout patch, see figure_variants.write_figure_variants. Any network
+        layers of this context are drawn on top first
+        """
+        if self.layers:
+            add_network_layers(fig, self.networks())
+        write_figure_variants(fig, self.output_dir, name, self.plotlyjs_tag(), variants)
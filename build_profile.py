@@ -0,0 +1,137 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# Named stages of a map build (ingest, join, dissolve, geojson, serialize, write...) wrap themselves in stage(name).
+# While a recorder is active each stage's wall time, cpu time, calls and row counts are added to it, and its peak
+# memory when the recorder traces memory. Otherwise stage costs nothing.
+# Stages can nest. Each records only its own time, time spent in stages inside it is counted by those stages
+
+_recorder = None
+
+class StageHandle:
+    """
+    Yielded by stage so the code inside can report how many rows it handled
+    """
+    def __init__(self):
+        self.n_rows = None
+
+    def rows(self, data):
+        """
+        Records len(data) as the stage's row count and returns data, e.g. return s.rows(df)
+        """
+        self.n_rows = (self.n_rows or 0) + len(data)
+        return data
+
+class StageRecorder:
+    """
+    Collects wall and cpu seconds, calls, rows and peak memory for each named stage
+
+    With trace_memory tracemalloc runs while recording. With profile_stage that stage is run under cProfile
+    """
+    def __init__(self, trace_memory=False, profile_stage=None):
+        self.stages = {}
+        self.trace_memory = trace_memory
+        self.profile_stage = profile_stage
+        self.profile = cProfile.Profile() if profile_stage else None
+        self._profiling = False
+        # time and memory peak of the stages running inside each open stage
+        self._children = [[0.0, 0.0]]
+        self._peaks = [0]
+
+    def add(self, name, wall, cpu, rows, peak):
+        record = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0, 'rows': None, 'peak_mb': None})
+        record['wall'] += wall
+        record['cpu'] += cpu
+        record['calls'] += 1
+        if rows is not None:
+            record['rows'] = (record['rows'] or 0) + rows
+        if peak is not None:
+            record['peak_mb'] = max(record['peak_mb'] or 0.0, peak / 1e6)
+
+    def profile_stats(self, limit=25):
+        """
+        Returns the top functions of the profiled stage by cumulative time, as text
+        """
+        if not self.profile:
+            return None
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def report(self):
+        return {'stages': self.stages, 'profile_stage': self.profile_stage, 'profile': self.profile_stats()}
+
+@contextmanager
+def stage(name):
+    """
+    Records the code inside the with block as stage name when a recorder is active. Yields a StageHandle
+    """
+    recorder = _recorder
+    handle = StageHandle()
+    if recorder is None:
+        yield handle
+        return
+
+    # the parent's peak so far is kept before the peak is reset for this stage
+    if recorder.trace_memory:
+        recorder._peaks[-1] = max(recorder._peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    recorder._peaks.append(0)
+    recorder._children.append([0.0, 0.0])
+    profiling = name == recorder.profile_stage and not recorder._profiling
+    if profiling:
+        recorder._profiling = True
+        recorder.profile.enable()
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        yield handle
+    finally:
+        wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+        if profiling:
+            recorder.profile.disable()
+            recorder._profiling = False
+        child_wall, child_cpu = recorder._children.pop()
+        recorder._children[-1][0] += wall
+        recorder._children[-1][1] += cpu
+        peak = None
+        if recorder.trace_memory:
+            peak = max(recorder._peaks.pop(), tracemalloc.get_traced_memory()[1])
+            recorder._peaks[-1] = max(recorder._peaks[-1], peak)
+        else:
+            recorder._peaks.pop()
+        recorder.add(name, wall - child_wall, cpu - child_cpu, handle.n_rows, peak)
+
+@contextmanager
+def recording(trace_memory=False, profile_stage=None):
+    """
+    Makes a new StageRecorder active for the with block and yields it
+    """
+    global _recorder
+    previous = _recorder
+    _recorder = StageRecorder(trace_memory, profile_stage)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        yield _recorder
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        _recorder = previous
+
+def write_report(report_dir, report):
+    """
+    Writes a build report dict to report_dir/build_<timestamp>.json and returns its path
+    """
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f'build_{datetime.now():%Y%m%d_%H%M%S}.json')
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+    return path
@@ -0,0 +1,92 @@
+import ast
+import glob
+import hashlib
+import inspect
+import json
+import os
+from build_cache import source_hash
+from figure_variants import variant_files
+
+# every map depends on the county labels, so they are added to each map's inputs
+shared_inputs = ['data/label_geography.csv']
+
+def map_inputs(module):
+    """
+    Expands the input patterns declared by a map module into a sorted list of files
+    """
+    paths = set()
+    for pattern in shared_inputs + module.inputs:
+        paths.update(glob.glob(pattern))
+    return sorted(paths)
+
+def local_imports(path):
+    """
+    Returns the names of the modules next to path that the script at path imports, anywhere in the file
+    """
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split('.')[0])
+    folder = os.path.dirname(path)
+    return {name for name in names if os.path.exists(os.path.join(folder, f'{name}.py'))}
+
+def code_files(module, map_modules):
+    """
+    Returns the map script itself plus every module next to it that the script imports, directly or through
+    another of those modules. Other map scripts are left out, so editing one map, a test or a tool that no
+    map imports does not invalidate the maps
+    """
+    script = os.path.relpath(inspect.getfile(module))
+    folder = os.path.dirname(script)
+    seen = set()
+    pending = [script]
+    while pending:
+        for name in local_imports(pending.pop()):
+            if name not in seen and name not in map_modules:
+                seen.add(name)
+                pending.append(os.path.join(folder, f'{name}.py'))
+    return [script] + sorted(os.path.join(folder, f'{name}.py') for name in seen)
+
+def map_stamp(module, map_modules, settings=None):
+    """
+    Returns a dict of every file a map depends on and its content hash, plus one combined key
+
+    settings are any build options that change the output, e.g. how plotly.js is included
+    """
+    hashes = {path: source_hash(path) for path in map_inputs(module) + code_files(module, map_modules)}
+    settings = settings or {}
+    key = hashlib.sha256(json.dumps([hashes, settings], sort_keys=True).encode()).hexdigest()
+    return {'key': key, 'files': hashes, 'settings': settings}
+
+def stamp_path(context, module):
+    return os.path.join(context.output_dir, f'{module.output_name}.stamp')
+
+def is_up_to_date(context, module, stamp):
+    """
+    True if every file the map wrote last time is still there, and it was built from exactly the same inputs and
+    code as stamp. With the local plotlyjs setting the shared plotly.min.js has to be there too
+    """
+    path = stamp_path(context, module)
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        previous = json.load(f)
+    if previous.get('key') != stamp['key']:
+        return False
+
+    outputs = previous.get('outputs') or [os.path.basename(context.output_path(module.output_name))]
+    if context.plotlyjs == 'local':
+        outputs = outputs + ['plotly.min.js']
+    return all(os.path.exists(os.path.join(context.output_dir, name)) for name in outputs)
+
+def write_stamp(context, module, stamp):
+    """
+    Writes stamp next to the map, along with the names of the files the build just wrote
+    """
+    outputs = [os.path.basename(path) for path in variant_files(context.output_dir, module.output_name)]
+    with open(stamp_path(context, module), 'w') as f:
+        json.dump({**stamp, 'outputs': outputs}, f, indent=1, sort_keys=True)
@@ -0,0 +1,108 @@
+import argparse
+import importlib
+import inspect
+import os
+import pandas as pd
+from build_cache import cached_frame, write_atomically
+from build_profile import stage
+from build_stamps import map_inputs
+from reference_data import regions_svi_path
+
+# helper modules the fact modules read and rank their data with. A change to any of them changes the table
+helper_modules = ['county_index.py', 'dataset_catalog.py', 'ranking.py']
+
+# One wide table with a row per county and a column per metric of every county level chapter map, keyed by the
+# integer county_code and carrying the county name, state and region. Each map module reads its own data in
+# read_facts and names its columns in fact_columns, the table joins them onto the county list once, and the maps
+# then select their columns from it (select_facts) rather than each joining its own data to the counties.
+# The table is cached as parquet in the cache folder and build_all writes a copy next to the maps
+
+# map modules that add columns to the table, in column order
+fact_modules = ['forestry_map', 'soils_map_v2', 'dac_map', 'geostorage_map', 'eeej_map']
+
+# name of the parquet file written to the output folder
+output_name = 'county_facts'
+
+def fact_sources():
+    """
+    Returns every file the fact table is built from, the data of each fact module plus the code that reads and
+    ranks it
+    """
+    modules = [importlib.import_module(name) for name in fact_modules]
+    # the zipped county and basalt shapefiles are geometry, none of them end up in the table
+    paths = {path for module in modules for path in map_inputs(module) if not path.endswith('.zip')}
+    paths.update(os.path.relpath(inspect.getfile(module)) for module in modules)
+    return sorted(paths) + helper_modules + [regions_svi_path, __file__]
+
+def read_county_facts(context):
+    """
+    Reads every fact module's data and returns the county table, one row per county in context.county_fips
+
+    Metric columns are floats and text columns categorical. Counties a module has no data for are left empty
+    """
+    frames = []
+    for name in fact_modules:
+        module = importlib.import_module(name)
+        df = module.read_facts()
+        df = df.drop_duplicates(subset='county_code').set_index('county_code')
+        frames.append(df[list(module.fact_columns)].rename(columns=module.fact_columns))
+
+    with stage('join') as s:
+        facts_df = context.county_fips[['county_code', 'County, State', 'State']].copy()
+        regions = context.region_mapping.drop_duplicates(subset='county_code').set_index('county_code')['Region']
+        facts_df['Region'] = regions.reindex(facts_df['county_code']).to_numpy()
+        # every module's columns are lined up with the county list in one join. Counties missing from it are dropped
+        facts_df = facts_df.set_index('county_code').join(frames, how='left').reset_index()
+
+        for column in facts_df.columns:
+            if column == 'county_code':
+                facts_df[column] = facts_df[column].astype('int32')
+            elif column == 'County, State':
+                facts_df[column] = facts_df[column].astype(str)
+            elif pd.api.types.is_numeric_dtype(facts_df[column]):
+                facts_df[column] = facts_df[column].astype('float64')
+            else:
+                facts_df[column] = facts_df[column].astype('category')
+        return s.rows(facts_df)
+
+def load_county_facts(context):
+    """
+    Returns the county fact table, rebuilt only when one of its sources or the code reading them has changed
+    """
+    return cached_frame('county_facts', fact_sources(), lambda: read_county_facts(context))
+
+def select_facts(facts_df, columns, required=None):
+    """
+    Takes the fact table and a dict of label to fact column and returns the counties that have any of those
+    columns, or the required column when given, with county_code, County, State and the columns under their labels
+
+    Categorical columns come back as plain text columns
+    """
+    required = [required] if required else list(columns.values())
+    df = facts_df.loc[facts_df[required].notna().any(axis=1), ['county_code', 'County, State', *columns.values()]]
+    df = df.rename(columns={fact: label for label, fact in columns.items()}).reset_index(drop=True)
+    for label in columns:
+        if isinstance(df[label].dtype, pd.CategoricalDtype):
+            df[label] = df[label].astype(object)
+    return df
+
+def write_county_facts(context):
+    """
+    Writes the county fact table to the output folder as county_facts.parquet and returns its path
+    """
+    path = os.path.join(context.output_dir, f'{output_name}.parquet')
+    os.makedirs(context.output_dir, exist_ok=True)
+    with stage('write'):
+        write_atomically(path, context.county_facts.to_parquet)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the county fact table of every county level chapter map')
+    parser.add_argument('--output-dir', default='chapter_maps', help='folder county_facts.parquet is written to')
+    args = parser.parse_args()
+    from build_context import BuildContext
+    path = write_county_facts(BuildContext(output_dir=args.output_dir))
+    print(f'Wrote {path}')
+
+if __name__ == '__main__':
+    main()
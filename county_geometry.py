@@ -0,0 +1,52 @@
+from build_cache import sources_key, cache_path, cached_json
+from build_profile import stage
+from geometry_prep import prepare_geometry
+from lazy_imports import lazy_module
+
+gpd = lazy_module('geopandas')
+
+# zipped census county shapefiles bundled with the repo. Resolution is one of '5m' or '20m'
+counties_zip_path = 'data/cb_2018_us_county_{resolution}.zip'
+
+# code the cached geojson is built with, part of its cache key
+builder_modules = [__file__, 'geometry_prep.py']
+
+def read_counties_shapefile(resolution='20m'):
+    """
+    Reads the bundled census county shapefile straight from its zip
+    """
+    zip_path = counties_zip_path.format(resolution=resolution)
+    with stage('ingest') as s:
+        return s.rows(gpd.read_file(f'{zip_path}!cb_2018_us_county_{resolution}.shp'))
+
+def build_counties_geojson(resolution='20m', tolerance=None, decimals=None, shared_arcs=False):
+    """
+    Builds a county FeatureCollection from the bundled shapefile
+
+    Feature ids are the 5 digit FIPS code, and each feature carries properties.GEO_ID (0500000US + FIPS)
+    so it is a drop in replacement for plotly's geojson-counties-fips.json. The geometry is simplified and
+    rounded by geometry_prep when tolerance or decimals are given
+    """
+    census_gdf = read_counties_shapefile(resolution)
+    census_gdf = census_gdf.rename(columns={'AFFGEOID':'GEO_ID'})
+    census_gdf = census_gdf[['GEOID', 'GEO_ID', 'STATEFP', 'NAME', 'geometry']].set_index('GEOID', drop=False)
+    return prepare_geometry(census_gdf, tolerance, decimals, shared_arcs)
+
+def load_counties(resolution='20m', tolerance=None, decimals=None, shared_arcs=False):
+    """
+    Returns the county FeatureCollection for the given resolution and geometry settings
+
+    The geojson is built once and cached on disk, keyed by the shapefile hash, the code building it, resolution
+    and settings
+    """
+    zip_path = counties_zip_path.format(resolution=resolution)
+    key = sources_key([zip_path, *builder_modules], tolerance, decimals, shared_arcs)
+    path = cache_path('counties', f'{resolution}_{key}', 'json')
+    return cached_json(path, lambda: build_counties_geojson(resolution, tolerance, decimals, shared_arcs))
+
+def load_counties_gdf(resolution='20m'):
+    """
+    Returns the cached counties as a GeoDataFrame with GEOID, GEO_ID, STATEFP and NAME columns
+    """
+    counties = load_counties(resolution)
+    return gpd.GeoDataFrame.from_features(counties['features'], crs='EPSG:4269')
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+# Counties are keyed by one integer code everywhere inside the build, e.g. 1001 for Autauga, AL. The FIPS and
+# GEO_ID strings are only made when a map needs them for its locations
+
+# code for values that couldn't be parsed as a county
+missing_code = -1
+geo_id_prefix = '0500000US'
+
+def county_codes(values):
+    """
+    Parses county ids in any of the formats found in the data into int32 county codes
+
+    Handles ints and floats (1001, 1001.0), FIPS strings with or without zero padding ('1001', '01001') and
+    census GEO_IDs ('0500000US01001'). Anything else becomes missing_code
+    """
+    values = pd.Series(values)
+    if not pd.api.types.is_numeric_dtype(values):
+        values = values.astype('string').str.strip().str.replace(geo_id_prefix, '', regex=False)
+    codes = pd.to_numeric(values, errors='coerce')
+    return pd.Series(np.where(codes.notna(), codes.fillna(missing_code), missing_code).astype('int32'), index=values.index)
+
+def fips_strings(codes):
+    """
+    Returns the zero padded 5 digit FIPS string for each county code
+    """
+    codes = pd.Series(codes)
+    return codes.astype('string').str.zfill(5).where(codes != missing_code)
+
+def geo_ids(codes):
+    """
+    Returns the census GEO_ID (0500000US + FIPS) for each county code, matching properties.GEO_ID in the county geojson
+    """
+    return geo_id_prefix + fips_strings(codes)
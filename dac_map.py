@@ -1,98 +1,150 @@
-from requests import get
-import json
-import pandas as pd
-import numpy as np
-import math
-import seaborn as sns
-import plotly.express as px
 import plotly.graph_objects as go
-from dash import Dash, dcc, html, Input, Output
-import os
+from build_context import BuildContext
+from county_facts import select_facts
+from county_index import county_codes, geo_ids
+from dataset_catalog import read_dataset
+from figure_variants import colorbar_off_layout
+from geometry_prep import feature_subset
 
 # folder holding all forestry cdr data
 dac_path = 'data/DAC CDR'
 
-# data from census linking county name and fips
-county_fips_df = pd.read_csv('data/label_geography.csv', dtype={'geography':'str'})
-county_fips_df = county_fips_df[county_fips_df['geo_level']=='C']
-county_fips_df = county_fips_df.rename(columns={'label':'County, State', 'geography':'FIPS'})
-
-# load DAC data
-sorbent_df = pd.read_csv(dac_path + '/Sorbent_HP_2050_Cty_wtavg_11_cutoff-100ktpa.csv', dtype={'county':str})
-solvent_df = pd.read_csv(dac_path + '/Solvent_2050_Cty_wtavg_11.csv', dtype={'county':str})
-
-# rename columns to something pretty
-sorbent_df = sorbent_df.rename(columns={'county_DACcap_tpa':'Sorbent CDR Capacity',
-                                        'county_DACcost_wtavg':'Sorbent Cost'})
-solvent_df = solvent_df.rename(columns={'cty_region_DACcap_tpa':'Solvent Region CDR Capacity',
-                                        'county_DACcost_wtavg':'Solvent Weighted Average Cost'})
-# round numbers
-sorbent_df['Sorbent CDR Capacity'] = sorbent_df['Sorbent CDR Capacity'].round(-3)
-solvent_df['Solvent Region CDR Capacity'] = solvent_df['Solvent Region CDR Capacity'].round(-3)
-sorbent_df['Sorbent Cost'] = sorbent_df['Sorbent Cost'].round(-1)
-
-# merge everthing together
-dac_df = sorbent_df.merge(solvent_df, on='county')
-dac_df = dac_df.merge(county_fips_df, left_on='county', right_on='FIPS')
-dac_df['GEO_ID'] = '0500000US' + dac_df['county']
-
-# geo json file
-from urllib.request import urlopen
-with urlopen('https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json') as response:
-    counties = json.load(response)
-
-# make choropleth for dac. Use colors for sorbent only, but report solvent as well on hover text
-fig = go.Figure(go.Choropleth())
-fig.update_geos(scope='usa')
-
-# Convert to million tons
-dac_df['Sorbent CDR Capacity'] = dac_df['Sorbent CDR Capacity']/1000000
-
-# geostorage map only needs one trace
-fig.add_trace(trace=go.Choropleth(
-    geojson=counties,
-    locationmode="geojson-id",
-    locations=dac_df['GEO_ID'],
-    featureidkey='properties.GEO_ID',
-    z=dac_df['Sorbent CDR Capacity'],
-    zmax=dac_df['Sorbent CDR Capacity'].quantile(.95),
-    zmin=dac_df['Sorbent CDR Capacity'].quantile(.05),
-    colorscale='greens',
-    customdata=dac_df[['County, State', 'Sorbent CDR Capacity', 'Sorbent Cost', 'Solvent Region CDR Capacity', 'Solvent Weighted Average Cost']],
-    hovertemplate='<b>County</b>: %{customdata[0]}<br>' +
-                    '<b>Adsorbent DACS CDR Potential </b>: %{customdata[1]:,.0f} Million Tonnes CO<sub>2</sub> Per Year<br>' +
-                    '<b>Adsorbent CDR Cost</b>: %{customdata[2]:,.0f} USD per Tonne CO<sub>2</sub><br>' +
-                    # '<b>Regional Solvent CDR Potential by 2050</b>: %{customdata[3]:,.0f} Tonnes CO<sub>2</sub><br>' +
-                    # '<b>Regional Solvent CDR Cost</b>: %{customdata[4]:,.2f} USD per Tonne CO<sub>2</sub><br>' +
-                    '<extra></extra>'))
-
-# Get rid of color bar. All color bars overlap right now, so it looks neater without them
-# fig.update_traces(showscale=False)
-
-for i, trace in enumerate(fig.data, 1):
-    trace.update(coloraxis=f"coloraxis{i}")
-    
-fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0},
-                  coloraxis2={"colorbar": {"x": 0.50, 
-                                           "len": 0.75, 
-                                           "y": -0.3, 
-                                           'title':'Potential Adsorbent DACS Capacity<br>Tonnes CO<sub>2</sub> Removed Per Year',
-                                           'orientation':'h',
-                                           'titlefont':{'size':10},
-                                           'tickfont':{'size':10}
-                                           },
-                                'colorscale':'greens',
-                                'cmax':dac_df['Sorbent CDR Capacity'].quantile(.98),
-                                'cmin':0})
-
-fig.update_coloraxes(colorbar_title_side='top')
-fig.write_html('chapter_maps/dac_map.html')
-# save version with no cbar
-for i in range(len(fig.data)):
-    fig.update_layout({f'coloraxis{i+1}':{'showscale':False}})
-
-fig.show()
-fig.write_html('chapter_maps/dac_map_nocbar.html')
-
-
-
+# name of the html file written to chapter_maps
+output_name = 'dac_map'
+
+# simplification and rounding of the county polygons embedded in this map, see geometry_prep
+geometry_settings = {'resolution': '20m', 'tolerance': 0.005, 'decimals': 3}
+
+# files this map is built from. The map is only rebuilt when one of these, or the code, changes
+inputs = [dac_path + '/Sorbent_HP_2050_Cty_wtavg_11_cutoff-100ktpa.csv',
+          dac_path + '/Solvent_2050_Cty_wtavg_11.csv',
+          'data/cb_2018_us_county_20m.zip']
+
+capacity_title = 'Potential Adsorbent DACS Capacity<br>Tonnes CO<sub>2</sub> Removed Per Year'
+
+# columns this map adds to the county fact table, label: fact column
+fact_columns = {'Sorbent CDR Capacity': 'dac_capacity',
+                'Sorbent Cost': 'dac_cost',
+                'Solvent Region CDR Capacity': 'dac_solvent_region_capacity',
+                'Solvent Weighted Average Cost': 'dac_solvent_cost'}
+
+def read_facts():
+    """
+    Reads the sorbent and solvent DAC data and returns it by county code, with sorbent capacity in million tonnes
+    """
+    # load DAC data
+    sorbent_df = read_dataset(dac_path + '/Sorbent_HP_2050_Cty_wtavg_11_cutoff-100ktpa.csv',
+                              columns=['county', 'county_DACcap_tpa', 'county_DACcost_wtavg'])
+    solvent_df = read_dataset(dac_path + '/Solvent_2050_Cty_wtavg_11.csv',
+                              columns=['county', 'cty_region_DACcap_tpa', 'county_DACcost_wtavg'])
+    sorbent_df['county_code'] = county_codes(sorbent_df['county'])
+    solvent_df['county_code'] = county_codes(solvent_df['county'])
+
+    # rename columns to something pretty
+    sorbent_df = sorbent_df.rename(columns={'county_DACcap_tpa':'Sorbent CDR Capacity',
+                                            'county_DACcost_wtavg':'Sorbent Cost'})
+    solvent_df = solvent_df.rename(columns={'cty_region_DACcap_tpa':'Solvent Region CDR Capacity',
+                                            'county_DACcost_wtavg':'Solvent Weighted Average Cost'})
+    # round numbers
+    sorbent_df['Sorbent CDR Capacity'] = sorbent_df['Sorbent CDR Capacity'].round(-3)
+    solvent_df['Solvent Region CDR Capacity'] = solvent_df['Solvent Region CDR Capacity'].round(-3)
+    sorbent_df['Sorbent Cost'] = sorbent_df['Sorbent Cost'].round(-1)
+
+    # merge everthing together
+    dac_df = sorbent_df.merge(solvent_df.drop(columns='county'), on='county_code')
+
+    # Convert to million tons
+    dac_df['Sorbent CDR Capacity'] = dac_df['Sorbent CDR Capacity']/1000000
+    return dac_df
+
+def load_dac(context):
+    """
+    Returns the DAC columns of the county fact table for the counties with DAC data, with county names
+    """
+    return select_facts(context.county_facts, fact_columns)
+
+def views(context):
+    """
+    Returns the metrics the map app can switch between, as new z values and color axis settings
+    """
+    dac_df = load_dac(context)
+    capacity = dac_df['Sorbent CDR Capacity']
+    cost = dac_df['Sorbent Cost']
+    # trace 0 is the empty choropleth, the dac trace is trace 1 on color axis 2
+    return {'Adsorbent DACS Capacity': {'data': {1: {'z': capacity.tolist()}},
+                                       'layout': {('coloraxis2', 'cmax'): capacity.quantile(.98),
+                                                  ('coloraxis2', 'cmin'): 0,
+                                                  ('coloraxis2', 'colorscale'): 'greens',
+                                                  ('coloraxis2', 'colorbar', 'title', 'text'): capacity_title}},
+            'Adsorbent DACS Cost': {'data': {1: {'z': cost.tolist()}},
+                                   'layout': {('coloraxis2', 'cmax'): cost.quantile(.98),
+                                              ('coloraxis2', 'cmin'): cost.quantile(.02),
+                                              ('coloraxis2', 'colorscale'): 'greens_r',
+                                              ('coloraxis2', 'colorbar', 'title', 'text'): 'Adsorbent DACS Cost<br>USD per Tonne CO<sub>2</sub>'}}}
+
+def make_figure(context):
+    """
+    Builds the DAC chapter map
+    """
+    dac_df = load_dac(context)
+
+    # geo json file. Built from the bundled census shapefile and cached locally
+    counties = context.counties(**geometry_settings)
+
+    # make choropleth for dac. Use colors for sorbent only, but report solvent as well on hover text
+    fig = go.Figure(go.Choropleth())
+    fig.update_geos(scope='usa')
+
+    # geostorage map only needs one trace, and only the counties it colors
+    locations = geo_ids(dac_df['county_code'])
+    fig.add_trace(trace=go.Choropleth(
+        geojson=feature_subset(counties, locations, 'properties.GEO_ID'),
+        locationmode="geojson-id",
+        locations=locations,
+        featureidkey='properties.GEO_ID',
+        z=dac_df['Sorbent CDR Capacity'],
+        zmax=dac_df['Sorbent CDR Capacity'].quantile(.95),
+        zmin=dac_df['Sorbent CDR Capacity'].quantile(.05),
+        colorscale='greens',
+        customdata=dac_df[['County, State', 'Sorbent CDR Capacity', 'Sorbent Cost', 'Solvent Region CDR Capacity', 'Solvent Weighted Average Cost']],
+        hovertemplate='<b>County</b>: %{customdata[0]}<br>' +
+                        '<b>Adsorbent DACS CDR Potential </b>: %{customdata[1]:,.0f} Million Tonnes CO<sub>2</sub> Per Year<br>' +
+                        '<b>Adsorbent CDR Cost</b>: %{customdata[2]:,.0f} USD per Tonne CO<sub>2</sub><br>' +
+                        # '<b>Regional Solvent CDR Potential by 2050</b>: %{customdata[3]:,.0f} Tonnes CO<sub>2</sub><br>' +
+                        # '<b>Regional Solvent CDR Cost</b>: %{customdata[4]:,.2f} USD per Tonne CO<sub>2</sub><br>' +
+                        '<extra></extra>'))
+
+    # Get rid of color bar. All color bars overlap right now, so it looks neater without them
+    # fig.update_traces(showscale=False)
+
+    for i, trace in enumerate(fig.data, 1):
+        trace.update(coloraxis=f"coloraxis{i}")
+
+    fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0},
+                      coloraxis2={"colorbar": {"x": 0.50,
+                                               "len": 0.75,
+                                               "y": -0.3,
+                                               'title':capacity_title,
+                                               'orientation':'h',
+                                               'titlefont':{'size':10},
+                                               'tickfont':{'size':10}
+                                               },
+                                    'colorscale':'greens',
+                                    'cmax':dac_df['Sorbent CDR Capacity'].quantile(.98),
+                                    'cmin':0})
+
+    fig.update_coloraxes(colorbar_title_side='top')
+    return fig
+
+def build(context):
+    """
+    Writes the DAC map and its no color bar version to the output folder
+    """
+    fig = make_figure(context)
+    # save version with no cbar. Only the layout differs, so it shares the figure data with the main map
+    context.write_map(fig, output_name, variants={'nocbar': colorbar_off_layout(fig)})
+    return fig
+
+if __name__ == '__main__':
+    fig = build(BuildContext())
+    fig.show()
@@ -0,0 +1,61 @@
+import os
+import pandas as pd
+from build_cache import cache_path, sources_key, write_atomically
+from build_profile import stage
+
+# Raw csv and excel sources are parsed once into parquet snapshots under cache/, keyed on the file contents.
+# Scripts then read only the columns they use from the snapshot instead of re-parsing the whole workbook
+
+excel_extensions = ('.xlsx', '.xls')
+
+def snapshot_name(path, sheet_name=None):
+    """
+    Returns the cache file name for a source file, or one sheet of a workbook
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    if sheet_name is not None:
+        name = f'{name}_{sheet_name}'
+    return 'dataset_' + name.replace(' ', '_').replace('/', '_')
+
+def parquet_safe(df):
+    """
+    Takes a freshly parsed df and makes it writable as parquet
+
+    Column labels become strings and columns mixing numbers and text are stored as text, pd.to_numeric still
+    works on them the way it did on the raw sheet
+    """
+    df = df.copy()
+    if not isinstance(df.columns, pd.MultiIndex):
+        df.columns = [str(column) for column in df.columns]
+    for column in df.columns:
+        if df[column].dtype == object and pd.api.types.infer_dtype(df[column], skipna=True).startswith('mixed'):
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    return df
+
+def _write_snapshot(path, df):
+    write_atomically(path, parquet_safe(df).to_parquet)
+
+def read_dataset(path, sheet_name=0, columns=None, **read_kwargs):
+    """
+    Returns a csv or one sheet of an excel workbook as a df, only keeping columns when given
+
+    The first read of a workbook parses every sheet into its own snapshot, so reading several sheets of one
+    workbook costs one parse. read_kwargs (dtype, header, index_col...) are passed to pandas and are part of
+    the snapshot key, as is this file so snapshots are remade when the conversion changes
+    """
+    with stage('ingest') as s:
+        key = sources_key([path, __file__], sorted(read_kwargs.items()))
+        is_excel = path.lower().endswith(excel_extensions)
+        snapshot = cache_path(snapshot_name(path, sheet_name if is_excel else None), key, 'parquet')
+
+        if not os.path.exists(snapshot):
+            if is_excel:
+                sheets = pd.read_excel(path, sheet_name=None, **read_kwargs)
+                # sheet_name can be a position or a name, snapshot both
+                for position, (name, df) in enumerate(sheets.items()):
+                    _write_snapshot(cache_path(snapshot_name(path, name), key, 'parquet'), df)
+                    _write_snapshot(cache_path(snapshot_name(path, position), key, 'parquet'), df)
+            else:
+                _write_snapshot(snapshot, pd.read_csv(path, **read_kwargs))
+
+        return s.rows(pd.read_parquet(snapshot, columns=columns))
@@ -1,127 +1,196 @@
-import json
 import pandas as pd
-import geopandas as gpd
-import numpy as np
-import math
-import plotly.express as px
 import plotly.graph_objects as go
-import os
+from build_context import BuildContext
+from county_facts import select_facts
+from county_index import county_codes, fips_strings
+from dataset_catalog import read_dataset
+from figure_variants import colorbar_off_layout
+from geometry_prep import feature_subset
+from ranking import top_k
 
 # folder holding all forestry cdr data
 eeej_path = 'data/EEEJ'
 def create_eeej_path(path):
     return "/".join([eeej_path, path])
 
-# data from census linking county name and fips
-county_fips_df = pd.read_csv('data/label_geography.csv', dtype={'geography':'str'})
-county_fips_df = county_fips_df[county_fips_df['geo_level']=='C']
-county_fips_df = county_fips_df.rename(columns={'label':'County, State', 'geography':'FIPS'})
-
-# read file taken from census. This should have Oglala 
-# counties_path = 'data/cb_2018_us_county_500k.zip!cb_2018_us_county_500k.shp'
-counties_path = 'data/cb_2018_us_county_20m.zip!cb_2018_us_county_20m.shp'
-census_gdf = gpd.read_file(counties_path, dtypes={'GEOID':str})
-# simplify geometry. This may be why filesize is so huge
-# census_gdf.geometry = census_gdf.geometry.simplify(500)
-census_gdf = census_gdf.set_index('GEOID')
-
-# load index to rule them all data
-cdr_scores_df = pd.read_csv(create_eeej_path('percentile_ranking_all_methods.csv'), dtype={'GEOID':str})
-# rename 'DAC' to 'DACS'
-cdr_scores_df.loc[cdr_scores_df['Highest CDR Method']=='DAC', 'Highest CDR Method'] = 'DACS'
-
-"""
-# some data like AK and HI wasn't included in the cdr data. Fill those values with the minimum score as BiCRS
-cdr_scores_df = cdr_scores_df.merge(county_fips_df, left_on='GEOID', right_on='FIPS', how='outer')
-cdr_scores_df['Highest CDR Method'] = cdr_scores_df['Highest CDR Method'].fillna('BiCRS')
-cdr_scores_df['Max EEEJ weighted CDR score'] = cdr_scores_df['Max EEEJ weighted CDR score'].fillna(.01)
-"""
+# name of the html file written to chapter_maps
+output_name = 'eeej_map'
 
+# simplification and rounding of the county polygons embedded in this map, see geometry_prep
+geometry_settings = {'resolution': '20m', 'tolerance': 0.005, 'decimals': 3}
 
 # define function to read all trifecta data
 def process_trifecta(path, cdr_method):
-    df = pd.read_excel(path, sheet_name=0, dtype={'GEOID':str})
+    df = read_dataset(path, sheet_name=0, columns=['GEOID', 'County, State', 'EEEJ Avg Index', 'SVI'], dtype={'GEOID':str})
+    df['county_code'] = county_codes(df['GEOID'])
     # keep only relevant columns
-    df = df.loc[:,['GEOID', 'County, State', 'EEEJ Avg Index', 'SVI']]
+    df = df.loc[:,['county_code', 'County, State', 'EEEJ Avg Index', 'SVI']]
     # calculate percentile rank of eeej
     df['EEEJ Percentile Rank'] = df['EEEJ Avg Index'].rank(pct=True)
     df['CDR Method'] = cdr_method
     return df
 
 # dictionary linking cdr method to its data
-methods_paths = {'Forests': create_eeej_path('trifecta/forestry_trifecta_v3.xlsx'), 
-                 'Soils': create_eeej_path('trifecta/soils_trifecta_v2.xlsx'), 
+methods_paths = {'Forests': create_eeej_path('trifecta/forestry_trifecta_v3.xlsx'),
+                 'Soils': create_eeej_path('trifecta/soils_trifecta_v2.xlsx'),
                  'BiCRS': create_eeej_path('trifecta/bicrs_trifecta_v5.xlsx'),
                  'DACS': create_eeej_path('trifecta/sorbent_dac_trifecta_v2.xlsx')}
 
-# dictionary processing all eeej dfs
-eeej_dfs = [process_trifecta(path, key) for key, path in methods_paths.items()]
-
-eeej_df = pd.concat(eeej_dfs)
-# merge cdr score with underlying EEEJ values
-cdr_scores_df = cdr_scores_df.merge(eeej_df, left_on=['GEOID', 'Highest CDR Method'], right_on=['GEOID', 'CDR Method'])
+# files this map is built from. The map is only rebuilt when one of these, or the code, changes
+inputs = [create_eeej_path('percentile_ranking_all_methods.csv'),
+          *methods_paths.values(),
+          'data/cb_2018_us_county_20m.zip']
 
 # dictionary showing color scheme
-color_dict = {'Forests': [[0, '#FFFFFF'], [1, '#0c6533']], 
-                 'Soils': [[0, '#FFFFFF'], [1, '#e58f17']], 
+color_dict = {'Forests': [[0, '#FFFFFF'], [1, '#0c6533']],
+                 'Soils': [[0, '#FFFFFF'], [1, '#e58f17']],
                  'BiCRS': [[0, '#FFFFFF'], [1, '#703b9b']],
                  'DACS': [[0, '#FFFFFF'], [1, '#2a58a8']]}
 
 fontsize=10
 
-# make choropleth for soils map
-fig = go.Figure()
-
-print(cdr_scores_df[cdr_scores_df['Highest CDR Method']=='DACS'])
-print(cdr_scores_df['Highest CDR Method'].value_counts())
-# create a trace for each cdr method
-for i, method in enumerate(methods_paths.keys(), 1):
-    # Filter for method
-    df = cdr_scores_df.loc[cdr_scores_df['Highest CDR Method'] == method]
-
-    # create map
-    fig.add_trace(trace=go.Choropleth(
-        geojson=json.loads(census_gdf.geometry.to_json()),
-        locations=df['GEOID'],
-        z=df['Max EEEJ weighted CDR score'],
-        zauto= True,
-        coloraxis= f'coloraxis{i}',
-        # colorscale=color_dict.get(method, 'Viridis'),
-        customdata=df[['Highest CDR Method', 'County, State_x', 'EEEJ Percentile Rank', 'SVI']],
-        hovertemplate='<b>Top Practice</b>: %{customdata[0]}<br>' +
-                        '<b>County</b>: %{customdata[1]}<br>' +
-                        '<b>Equity Weighted CDR Score</b>: %{z:,.2f}<br>'
-                        '<b>EEEJ Opportunity Percentile</b>: %{customdata[2]:,.2f}<br>' +
-                        '<b>Social Vulnerability Index</b>: %{customdata[3]:,.2f}<br>' +
-                        '<extra></extra>'))
-    
-    fig.update_layout({f'coloraxis{i}':{'colorscale':color_dict.get(method, 'Viridis'),
-                                        'colorbar': {"x": 0 + (0.2 * i),
-                                                    "len": 0.2,
-                                                     "y": -0.3,
-                                                    'title': method,
-                                                    'orientation':'h',
-                                                    'titlefont':{'size':fontsize},
-                                                    'tickfont':{'size':fontsize}},
-                                        'cmax': 1,
-                                        'cmin': 0,
-                                        #'showscale': False
-                                        }                   
-                        })
-    
-    # Get rid of color bar. All color bars overlap right now, so it looks neater without them
-    # fig.update_traces(showscale=False)
-fig.update_coloraxes(colorbar_title_side='top')
-fig.update_geos(scope='usa')
-fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
-
-#fig.show()
-fig.write_html('chapter_maps/eeej_map.html', full_html=False, include_plotlyjs='cdn')
-# turn off legend for all caxis
-for i in range(len(fig.data)):
-    fig.update_layout({f'coloraxis{i+1}':{'showscale':False}})
-fig.show()
-fig.write_html('chapter_maps/eeej_map_nocbar.html')
-
-
-
+# columns this map adds to the county fact table, label: fact column. The EEEJ index, percentile and SVI are
+# those of each county's highest scoring method
+fact_columns = {**{f'{method} EEEJ weighted CDR score': f'eeej_score_{method.lower()}' for method in methods_paths.keys()},
+                'Highest CDR Method': 'eeej_method',
+                'Max EEEJ weighted CDR score': 'eeej_score',
+                'EEEJ Avg Index': 'eeej_index',
+                'EEEJ Percentile Rank': 'eeej_percentile',
+                'SVI': 'svi'}
+
+def read_facts():
+    """
+    Reads the EEEJ weighted cdr scores and attaches the EEEJ index and SVI of each county's highest scoring method
+    """
+    # load index to rule them all data
+    cdr_scores_df = read_dataset(create_eeej_path('percentile_ranking_all_methods.csv'), dtype={'GEOID':str})
+    cdr_scores_df['county_code'] = county_codes(cdr_scores_df['GEOID'])
+
+    # rank the per method scores. The csv names DACS 'DAC'
+    score_cols = {f'EEEJ weighted CDR score_{method.replace("DACS", "DAC")}': method for method in methods_paths.keys()}
+    scores_df = cdr_scores_df[list(score_cols.keys())].rename(columns=score_cols)
+    ranks = top_k(scores_df, k=1)
+    # counties the csv has no scores for (mostly Alaska) keep the method and score the csv gives them
+    csv_methods = cdr_scores_df['Highest CDR Method'].replace({'DAC': 'DACS'})
+    cdr_scores_df['Highest CDR Method'] = ranks['method1'].fillna(csv_methods)
+    cdr_scores_df['Max EEEJ weighted CDR score'] = ranks['value1'].fillna(cdr_scores_df['Max EEEJ weighted CDR score'])
+    cdr_scores_df = cdr_scores_df.rename(columns={col: f'{method} EEEJ weighted CDR score' for col, method in score_cols.items()})
+    cdr_scores_df = cdr_scores_df.dropna(subset=['Highest CDR Method'])
+
+    """
+    # some data like AK and HI wasn't included in the cdr data. Fill those values with the minimum score as BiCRS
+    cdr_scores_df = cdr_scores_df.merge(county_fips_df, left_on='GEOID', right_on='FIPS', how='outer')
+    cdr_scores_df['Highest CDR Method'] = cdr_scores_df['Highest CDR Method'].fillna('BiCRS')
+    cdr_scores_df['Max EEEJ weighted CDR score'] = cdr_scores_df['Max EEEJ weighted CDR score'].fillna(.01)
+    """
+
+    # dictionary processing all eeej dfs
+    eeej_dfs = [process_trifecta(path, key) for key, path in methods_paths.items()]
+
+    eeej_df = pd.concat(eeej_dfs).drop(columns='County, State')
+    # merge cdr score with underlying EEEJ values
+    cdr_scores_df = cdr_scores_df.merge(eeej_df, left_on=['county_code', 'Highest CDR Method'], right_on=['county_code', 'CDR Method'])
+    return cdr_scores_df
+
+def load_cdr_scores(context):
+    """
+    Returns the EEEJ columns of the county fact table for the counties with a highest scoring method, with county names
+    """
+    return select_facts(context.county_facts, fact_columns, required=fact_columns['Highest CDR Method'])
+
+def method_frames(cdr_scores_df):
+    """
+    Returns a dict of cdr method to the counties where it scores highest, one per map trace
+    """
+    return {method: cdr_scores_df.loc[cdr_scores_df['Highest CDR Method'] == method] for method in methods_paths.keys()}
+
+# metrics the map app can switch between. The first is the one drawn by make_figure
+view_metrics = {'Equity Weighted CDR Score': 'Max EEEJ weighted CDR score',
+                'EEEJ Opportunity Percentile': 'EEEJ Percentile Rank',
+                'Social Vulnerability Index': 'SVI'}
+
+def hover_template(z_label):
+    """
+    Returns the hover text of a method trace, with z labelled as z_label
+    """
+    return ('<b>Top Practice</b>: %{customdata[0]}<br>' +
+            '<b>County</b>: %{customdata[1]}<br>' +
+            f'<b>{z_label}</b>: ' + '%{z:,.2f}<br>'
+            '<b>EEEJ Opportunity Percentile</b>: %{customdata[2]:,.2f}<br>' +
+            '<b>Social Vulnerability Index</b>: %{customdata[3]:,.2f}<br>' +
+            '<extra></extra>')
+
+def views(context):
+    """
+    Returns the metrics the map app can switch between, as new z values for each method's trace
+    """
+    method_dfs = method_frames(load_cdr_scores(context))
+    # all three metrics run from 0 to 1, so the color axes stay as they are
+    return {label: {'data': {i: {'z': df[col].tolist(), 'hovertemplate': hover_template(label)}
+                             for i, df in enumerate(method_dfs.values())}}
+            for label, col in view_metrics.items()}
+
+def make_figure(context):
+    """
+    Builds the EEEJ chapter map
+    """
+    cdr_scores_df = load_cdr_scores(context)
+
+    # read file taken from census. This should have Oglala
+    # counties_path = 'data/cb_2018_us_county_500k.zip!cb_2018_us_county_500k.shp'
+    # feature ids are the 5 digit GEOID
+    counties = context.counties(**geometry_settings)
+    # geometry is simplified and rounded by geometry_prep using geometry_settings. This was why filesize was so huge
+
+    # make choropleth for soils map
+    fig = go.Figure()
+
+    # create a trace for each cdr method
+    for i, (method, df) in enumerate(method_frames(cdr_scores_df).items(), 1):
+        # feature ids are the 5 digit FIPS
+        locations = fips_strings(df['county_code'])
+
+        # create map. Each trace only embeds the counties it colors
+        fig.add_trace(trace=go.Choropleth(
+            geojson=feature_subset(counties, locations),
+            locations=locations,
+            z=df['Max EEEJ weighted CDR score'],
+            zauto= True,
+            coloraxis= f'coloraxis{i}',
+            # colorscale=color_dict.get(method, 'Viridis'),
+            customdata=df[['Highest CDR Method', 'County, State', 'EEEJ Percentile Rank', 'SVI']],
+            hovertemplate=hover_template('Equity Weighted CDR Score')))
+
+        fig.update_layout({f'coloraxis{i}':{'colorscale':color_dict.get(method, 'Viridis'),
+                                            'colorbar': {"x": 0 + (0.2 * i),
+                                                        "len": 0.2,
+                                                         "y": -0.3,
+                                                        'title': method,
+                                                        'orientation':'h',
+                                                        'titlefont':{'size':fontsize},
+                                                        'tickfont':{'size':fontsize}},
+                                            'cmax': 1,
+                                            'cmin': 0,
+                                            #'showscale': False
+                                            }
+                            })
+
+        # Get rid of color bar. All color bars overlap right now, so it looks neater without them
+        # fig.update_traces(showscale=False)
+    fig.update_coloraxes(colorbar_title_side='top')
+    fig.update_geos(scope='usa')
+    fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
+    return fig
+
+def build(context):
+    """
+    Writes the EEEJ map and its no color bar version to the output folder
+    """
+    fig = make_figure(context)
+    # save version with no cbar. Only the layout differs, so it shares the figure data with the main map
+    context.write_map(fig, output_name, variants={'nocbar': colorbar_off_layout(fig)})
+    return fig
+
+if __name__ == '__main__':
+    fig = build(BuildContext())
+    fig.show()
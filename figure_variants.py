@@ -0,0 +1,137 @@
+import glob
+import json
+import os
+from build_cache import write_atomically
+from build_profile import stage
+
+# Small html page that draws a figure stored in a shared .figure.js file. The layout patch is merged into the
+# figure's layout before plotting, and ?colorbar=0 in the url hides every color bar. Relative mapbox layer sources,
+# e.g. the tiles/{z}/{x}/{y}.pbf of the vector tile maps, are made absolute against the page url first, since
+# mapbox-gl fetches tiles from a web worker where relative urls don't resolve
+variant_template = '''<html>
+<head><meta charset="utf-8" /></head>
+<body style="margin: 0; height: 100%;">
+    <div id="{name}" class="plotly-graph-div" style="height: 100%; width: 100%;"></div>
+    {plotlyjs}
+    <script type="text/javascript" src="{data_file}"></script>
+    <script type="text/javascript">
+        function mergeLayout(target, patch) {{
+            for (var key in patch) {{
+                if (patch[key] !== null && typeof patch[key] === 'object' && !Array.isArray(patch[key])) {{
+                    target[key] = mergeLayout(target[key] || {{}}, patch[key]);
+                }} else {{
+                    target[key] = patch[key];
+                }}
+            }}
+            return target;
+        }}
+        function resolveSources(layout) {{
+            var base = window.location.href.replace(/[?#].*$/, '').replace(/[^/]*$/, '');
+            var layers = (layout.mapbox && layout.mapbox.layers) || [];
+            layers.forEach(function (layer) {{
+                if (!Array.isArray(layer.source)) {{
+                    return;
+                }}
+                layer.source = layer.source.map(function (url) {{
+                    if (typeof url !== 'string' || /^[a-z][a-z0-9+.-]*:/i.test(url)) {{
+                        return url;
+                    }}
+                    return url.charAt(0) === '/' ? window.location.origin + url : base + url;
+                }});
+            }});
+            return layout;
+        }}
+        var figure = window.PLOTLYFIGURES['{name}'];
+        var layout = mergeLayout(figure.layout, {layout_patch});
+        if (new URLSearchParams(window.location.search).get('colorbar') === '0') {{
+            layout = mergeLayout(layout, {colorbar_off});
+        }}
+        layout = resolveSources(layout);
+        Plotly.newPlot('{name}', figure.data, layout, {{responsive: true}});
+    </script>
+</body>
+</html>
+'''
+
+def colorbar_off_layout(fig):
+    """
+    Returns the layout patch that turns off the color bar of every color axis, for the _nocbar version of a map
+    """
+    # the patch is merged into the plain layout json, where the first color axis is coloraxis, not coloraxis1
+    return {'coloraxis' if i == 0 else f'coloraxis{i+1}': {'showscale': False} for i in range(len(fig.data))}
+
+def merge_layout(layout, patch):
+    """
+    Merges a layout patch into a layout dict the way the variant pages do, nested dicts key by key, and returns it
+    """
+    for key, value in patch.items():
+        if isinstance(value, dict):
+            layout[key] = merge_layout(dict(layout.get(key) or {}), value)
+        else:
+            layout[key] = value
+    return layout
+
+def view_menu(views, **menu):
+    """
+    Takes a map's views (see map_app) and returns a dropdown updatemenu that switches between them in the page
+
+    Each button only restyles the traces and layout paths its view changes, so the geometry is stored once and
+    every extra view adds just its numeric arrays. menu overrides the dropdown's position and style
+    """
+    buttons = []
+    for label, view in views.items():
+        traces = sorted(view.get('data', {}))
+        restyle = {}
+        for i in traces:
+            for key, value in view['data'][i].items():
+                restyle.setdefault(key, []).append(value)
+        relayout = {'.'.join(path): value for path, value in view.get('layout', {}).items()}
+        if relayout:
+            buttons.append(dict(label=label, method='update', args=[restyle, relayout, traces]))
+        else:
+            buttons.append(dict(label=label, method='restyle', args=[restyle, traces]))
+
+    position = {'pad': {'r': 10, 't': 10}, 'x': 0.5, 'xanchor': 'center', 'y': 1.1, 'yanchor': 'top'}
+    position.update(menu)
+    return dict(type='dropdown', direction='down', showactive=True, buttons=buttons, **position)
+
+def _script_json(data):
+    # keep '</script>' in strings from closing the script tag early
+    return json.dumps(data).replace('</', '<\\/')
+
+def variant_files(output_dir, name):
+    """
+    Returns the files write_figure_variants has written for name in output_dir, its figure data and every html page
+    """
+    patterns = [f'{name}.figure.js', f'{name}.html', f'{name}_*.html']
+    return sorted(path for pattern in patterns for path in glob.glob(os.path.join(output_dir, pattern)))
+
+def write_figure_variants(fig, output_dir, name, plotlyjs, variants=None):
+    """
+    Serializes fig once to name.figure.js, then writes name.html plus one small html file per variant
+
+    variants is a dict of file suffix to layout patch, e.g. {'nocbar': colorbar_off_layout(fig)} writes
+    name_nocbar.html. plotlyjs is the script tag that loads plotly.js
+    """
+    data_file = f'{name}.figure.js'
+    with stage('serialize'):
+        figure_js = f'window.PLOTLYFIGURES = window.PLOTLYFIGURES || {{}};\nwindow.PLOTLYFIGURES[{json.dumps(name)}] = {fig.to_json()};\n'
+
+    def write_text(text):
+        def write(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return write
+
+    with stage('write'):
+        os.makedirs(output_dir, exist_ok=True)
+        write_atomically(os.path.join(output_dir, data_file), write_text(figure_js))
+
+        for suffix, layout_patch in {'': {}, **(variants or {})}.items():
+            file_name = f'{name}_{suffix}.html' if suffix else f'{name}.html'
+            html = variant_template.format(name=name,
+                                           plotlyjs=plotlyjs,
+                                           data_file=data_file,
+                                           layout_patch=_script_json(layout_patch),
+                                           colorbar_off=_script_json(colorbar_off_layout(fig)))
+            write_atomically(os.path.join(output_dir, file_name), write_text(html))
@@ -1,130 +1,163 @@
-from tkinter import font
-from requests import get
-import json
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
-from dash import Dash, dcc, html, Input, Output
-import os
+from build_context import BuildContext
+from county_facts import select_facts
+from county_index import county_codes, geo_ids
+from dataset_catalog import read_dataset
+from figure_variants import colorbar_off_layout
+from geometry_prep import feature_subset
 
 # folder holding all forestry cdr data
 forestry_path = 'data/Foresty CDR'
 
-# data from census linking county name and fips
-county_fips_df = pd.read_csv('data/label_geography.csv', dtype={'geography':'str'})
-county_fips_df = county_fips_df[county_fips_df['geo_level']=='C']
-county_fips_df = county_fips_df.rename(columns={'label':'County, State', 'geography':'FIPS'})
-print(county_fips_df.head())
+# name of the html file written to chapter_maps
+output_name = 'forestry_map'
+
+# simplification and rounding of the county polygons embedded in this map, see geometry_prep
+geometry_settings = {'resolution': '20m', 'tolerance': 0.005, 'decimals': 3}
+
+# files this map is built from. The map is only rebuilt when one of these, or the code, changes
+inputs = ['data/Foresty CDR/NE_Forest Area.csv',
+          'data/Foresty CDR/Total carbon stock change by county restoration 2050 high density.xlsx',
+          'data/Foresty CDR/western_county_potentials_with_names.csv',
+          'data/cb_2018_us_county_20m.zip']
+
+forest_names = ['Northeastern Forests', 'Southeastern Forests', 'Western Forests']
+forest_color_scales = {forest:color for forest, color in zip(forest_names, ['greens', 'blues', 'reds'])}
+color_axes = {forest:coloraxis for forest, coloraxis in zip(forest_names, ['coloraxis1', 'coloraxis2', 'coloraxis3'])}
+
+# columns this map adds to the county fact table, label: fact column
+fact_columns = {'Northeastern Forests': 'forest_cdr_northeastern',
+                'Southeastern Forests': 'forest_cdr_southeastern',
+                'Western Forests': 'forest_cdr_western'}
 
 def process_forestry_cdr(df):
     """
-    Standardizes fips formatting for cdr dfs
-    
+    Standardizes fips formatting for cdr dfs and returns the total cdr of each county with any
+
     First Column must be FIPS column and last column must be CDR column
     """
     df = df.rename(columns={df.columns[0]:'FIPS',
                            df.columns[-1]:'Total Tonnes CDR'})
-    df['FIPS'] = df['FIPS'].apply(lambda x: str(x).zfill(5))
-    # need to add '0500000US' to each GEOID so it matches th geo json file
-    df['GEO_ID'] = '0500000US' + df['FIPS']
-    df = df.merge(county_fips_df, on='FIPS')
-    return df[df['Total Tonnes CDR']>0]
-
-# forestry data is in 3 different spreadsheets
-ne_cdr_df = pd.read_csv(forestry_path + "/" + 'NE_Forest Area.csv', dtype={'FID':str})
-se_cdr_df = pd.read_excel(forestry_path + '/' + 'Total carbon stock change by county restoration 2050 high density.xlsx', dtype={'FIPS_County':str})
-w_cdr_df = pd.read_csv(forestry_path + '/' + 'western_county_potentials_with_names.csv', dtype={'FIPS_County':str})
-
-forest_names = ['Northeastern Forests', 'Southeastern Forests', 'Western Forests']
-forestry_cdr_dfs = {forest:process_forestry_cdr(df) for forest, df in zip(forest_names, [ne_cdr_df, se_cdr_df, w_cdr_df])}
-forest_color_scales = {forest:color for forest, color in zip(forest_names, ['greens', 'blues', 'reds'])}
-color_axes = {forest:coloraxis for forest, coloraxis in zip(forest_names, ['coloraxis1', 'coloraxis2', 'coloraxis3'])}
-# geo json file
-from urllib.request import urlopen
-with urlopen('https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json') as response:
-    counties = json.load(response)
-
-
-# make choropleth for forestry map
-fig = go.Figure(go.Choropleth())
-fig.update_geos(scope='usa')
-
-# create a trace for each forest's data
-for key, df in forestry_cdr_dfs.items():
-    print(df.head())
-    fig.add_trace(trace=go.Choropleth(
-        geojson=counties,
-        locationmode="geojson-id",
-        locations=df['GEO_ID'],
-        featureidkey='properties.GEO_ID',
-        z=df['Total Tonnes CDR'].round(-3)/1000000,
-        zmin=df['Total Tonnes CDR'].min(),
-        zmax=df['Total Tonnes CDR'].max(),
-        colorscale=forest_color_scales.get(key, 'viridis'),
-        # coloraxis=color_axes.get(key),
-        colorbar={'orientation':'h'},
-        colorbar_title=key,
-        name=key,
-        customdata=df[['County, State', 'Total Tonnes CDR']],
-        hovertemplate='<b>County</b>: %{customdata[0]}<br>' +
-                        '<b>CDR Potential by 2050</b>: %{z:,.2f} Million Tonnes CO<sub>2</sub><br>' +
-                        '<extra></extra>'))
-    
-    # Get rid of color bar. All color bars overlap right now, so it looks neater without them
-    # fig.update_traces(showscale=False)
-    
-fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
-
-# assign each trace to new color axis
-for i, trace in enumerate(fig.data, 1):
-    trace.update(coloraxis=f"coloraxis{i}")
-
-# configure color axes
-fontsize=10
-
-fig.update_layout(
-    coloraxis1={"colorbar": {"x": -0.2, "len": 0.5, "y": 0.8}},
-    coloraxis2={
-        "colorbar": {
-            "x": 0.8,
-            "len": 0.2,
-            "y": -0.3,
-            'title':'Northeastern Forests<br>CDR Potential by 2050 (Tonnes CO<sub>2</sub>)',
-            'orientation':'h',
-            'titlefont':{'size':fontsize},
-            'tickfont':{'size':fontsize}},
-        "colorscale":'greens',
-    },
-    coloraxis3={
-        "colorbar": {"x": 0.5, 
-                     "len": 0.2, 
-                     "y": -0.3, 
-                     'title':'Southeastern Forests<br>CDR Potential by 2050 (Tonnes CO<sub>2</sub>)',
-                     'orientation':'h',
-                     'titlefont':{'size':fontsize},
-                     'tickfont':{'size':fontsize}},
-        "colorscale":'blues'
-    },
-    coloraxis4={
-        "colorbar": {"x": 0.2, 
-                     "len": 0.2, 
-                     "y": -0.3,
-                     'title':'Western Forests<br>CDR Potential by 2050 (Tonnes CO<sub>2</sub>)',
-                     'orientation':'h',
-                     'titlefont':{'size':fontsize},
-                     'tickfont':{'size':fontsize}},
-        "colorscale": 'reds',
-            })
-
-fig.update_coloraxes(colorbar_title_side='top')
-fig.write_html('chapter_maps/forestry_map.html')
-# save file without legend
-for i in range(len(fig.data)):
-    fig.update_layout({f'coloraxis{i+1}':{'showscale':False}})
-
-fig.show()
-fig.write_html('chapter_maps/forestry_map_nocbar.html')
+    # integer county code, whatever format the FIPS column is in
+    df['county_code'] = county_codes(df['FIPS'])
+    df = df[df['Total Tonnes CDR']>0]
+    return df.groupby('county_code')['Total Tonnes CDR'].sum()
 
+def read_facts():
+    """
+    Reads the three forestry spreadsheets and returns each forest's cdr in its own column, by county code
+    """
+    # forestry data is in 3 different spreadsheets
+    # only the fips (first) and cdr (last) columns are used, see process_forestry_cdr
+    ne_cdr_df = read_dataset(forestry_path + "/" + 'NE_Forest Area.csv', columns=['FID', 'FOREST_ACREAGE'], dtype={'FID':str})
+    se_cdr_df = read_dataset(forestry_path + '/' + 'Total carbon stock change by county restoration 2050 high density.xlsx', dtype={'FIPS_County':str})
+    w_cdr_df = read_dataset(forestry_path + '/' + 'western_county_potentials_with_names.csv', columns=['FIPS_County', 'TSCdiff (metric tons)'], dtype={'FIPS_County':str})
 
+    # a county can be in more than one forest region
+    forests = {forest:process_forestry_cdr(df) for forest, df in zip(forest_names, [ne_cdr_df, se_cdr_df, w_cdr_df])}
+    return pd.DataFrame(forests).rename_axis('county_code').reset_index()
 
+def load_forestry(context):
+    """
+    Returns a dict of forest name to the counties with cdr in that forest, from the county fact table
+    """
+    return {forest:select_facts(context.county_facts, {'Total Tonnes CDR': fact_columns[forest]}) for forest in forest_names}
 
+def make_figure(context):
+    """
+    Builds the forestry chapter map
+    """
+    forestry_cdr_dfs = load_forestry(context)
+
+    # geo json file. Built from the bundled census shapefile and cached locally
+    counties = context.counties(**geometry_settings)
+
+    # make choropleth for forestry map
+    fig = go.Figure(go.Choropleth())
+    fig.update_geos(scope='usa')
+
+    # create a trace for each forest's data
+    for key, df in forestry_cdr_dfs.items():
+        # need to add '0500000US' to each county so it matches th geo json file
+        locations = geo_ids(df['county_code'])
+        # each trace only embeds the counties it colors
+        fig.add_trace(trace=go.Choropleth(
+            geojson=feature_subset(counties, locations, 'properties.GEO_ID'),
+            locationmode="geojson-id",
+            locations=locations,
+            featureidkey='properties.GEO_ID',
+            z=df['Total Tonnes CDR'].round(-3)/1000000,
+            zmin=df['Total Tonnes CDR'].min(),
+            zmax=df['Total Tonnes CDR'].max(),
+            colorscale=forest_color_scales.get(key, 'viridis'),
+            # coloraxis=color_axes.get(key),
+            colorbar={'orientation':'h'},
+            colorbar_title=key,
+            name=key,
+            customdata=df[['County, State', 'Total Tonnes CDR']],
+            hovertemplate='<b>County</b>: %{customdata[0]}<br>' +
+                            '<b>CDR Potential by 2050</b>: %{z:,.2f} Million Tonnes CO<sub>2</sub><br>' +
+                            '<extra></extra>'))
+
+        # Get rid of color bar. All color bars overlap right now, so it looks neater without them
+        # fig.update_traces(showscale=False)
+
+    fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
+
+    # assign each trace to new color axis
+    for i, trace in enumerate(fig.data, 1):
+        trace.update(coloraxis=f"coloraxis{i}")
+
+    # configure color axes
+    fontsize=10
+
+    fig.update_layout(
+        coloraxis1={"colorbar": {"x": -0.2, "len": 0.5, "y": 0.8}},
+        coloraxis2={
+            "colorbar": {
+                "x": 0.8,
+                "len": 0.2,
+                "y": -0.3,
+                'title':'Northeastern Forests<br>CDR Potential by 2050 (Tonnes CO<sub>2</sub>)',
+                'orientation':'h',
+                'titlefont':{'size':fontsize},
+                'tickfont':{'size':fontsize}},
+            "colorscale":'greens',
+        },
+        coloraxis3={
+            "colorbar": {"x": 0.5,
+                         "len": 0.2,
+                         "y": -0.3,
+                         'title':'Southeastern Forests<br>CDR Potential by 2050 (Tonnes CO<sub>2</sub>)',
+                         'orientation':'h',
+                         'titlefont':{'size':fontsize},
+                         'tickfont':{'size':fontsize}},
+            "colorscale":'blues'
+        },
+        coloraxis4={
+            "colorbar": {"x": 0.2,
+                         "len": 0.2,
+                         "y": -0.3,
+                         'title':'Western Forests<br>CDR Potential by 2050 (Tonnes CO<sub>2</sub>)',
+                         'orientation':'h',
+                         'titlefont':{'size':fontsize},
+                         'tickfont':{'size':fontsize}},
+            "colorscale": 'reds',
+                })
+
+    fig.update_coloraxes(colorbar_title_side='top')
+    return fig
+
+def build(context):
+    """
+    Writes the forestry map and its no color bar version to the output folder
+    """
+    fig = make_figure(context)
+    # save version with no cbar. Only the layout differs, so it shares the figure data with the main map
+    context.write_map(fig, output_name, variants={'nocbar': colorbar_off_layout(fig)})
+    return fig
+
+if __name__ == '__main__':
+    fig = build(BuildContext())
+    fig.show()
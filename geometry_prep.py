@@ -0,0 +1,87 @@
+import json
+import numpy as np
+from build_profile import stage
+from lazy_imports import lazy_module
+
+gpd = lazy_module('geopandas')
+shapely = lazy_module('shapely')
+
+# Geometry embedded in the maps is simplified and rounded before it is serialized. Each map sets its own
+# tolerance (in degrees) and number of decimals, so fidelity can be traded for html size one map at a time.
+# 0.005 degrees is roughly 500 m, and 3 decimals is roughly 100 m
+default_settings = {'tolerance': 0.005, 'decimals': 3, 'shared_arcs': False}
+
+def simplify_geometry(gdf, tolerance, shared_arcs=False):
+    """
+    Simplifies a GeoDataFrame's geometry without letting any polygon collapse or self intersect
+
+    With shared_arcs the borders shared by neighbouring polygons are simplified once as TopoJSON style arcs, so
+    neighbours still line up exactly afterwards. That needs the optional topojson package
+    """
+    if shared_arcs:
+        import topojson
+        return topojson.Topology(gdf, prequantize=False, toposimplify=tolerance, prevent_oversimplify=True).to_gdf()
+
+    gdf = gdf.copy()
+    gdf.geometry = gdf.geometry.simplify(tolerance, preserve_topology=True)
+    return gdf
+
+def round_coordinates(gdf, decimals):
+    """
+    Rounds every coordinate of a GeoDataFrame's geometry to the given number of decimals
+    """
+    gdf = gdf.copy()
+    geometry = shapely.transform(gdf.geometry.to_numpy(), lambda coords: np.round(coords, decimals))
+    gdf.geometry = gpd.GeoSeries(geometry, index=gdf.index, crs=gdf.crs)
+    return gdf
+
+def line_coordinates(geometries):
+    """
+    Takes an array of line geometries (or polygon rings) and returns their lon and lat lists
+
+    Every part becomes its own run of coordinates with None between runs, so any number of lines can be
+    drawn by a single Scattergeo trace
+    """
+    parts = shapely.get_parts(geometries)
+    coords, part_index = shapely.get_coordinates(parts, return_index=True)
+
+    # gap where each new part starts
+    starts = np.flatnonzero(np.diff(part_index)) + 1
+    coords = np.insert(coords, starts, np.nan, axis=0)
+    # None breaks the line in plotly, NaN isn't valid json
+    lons, lats = (np.where(np.isnan(column), None, column).tolist() for column in coords.T)
+    return lons, lats
+
+def feature_subset(geojson, ids, featureidkey='id'):
+    """
+    Takes a FeatureCollection and returns one with only the features whose featureidkey (a trace's featureidkey,
+    e.g. 'properties.GEO_ID') is in ids
+
+    Each trace of a multi trace map embeds its own geojson, so giving every trace only the features of its own
+    locations keeps each polygon in the html once instead of once per trace
+    """
+    path = featureidkey.split('.')
+    ids = set(ids)
+
+    def feature_id(feature):
+        for key in path:
+            feature = feature.get(key) if isinstance(feature, dict) else None
+        return feature
+
+    return {**geojson, 'features': [feature for feature in geojson['features'] if feature_id(feature) in ids]}
+
+def prepare_geometry(gdf, tolerance=None, decimals=None, shared_arcs=False):
+    """
+    Simplifies and rounds a GeoDataFrame for the web and returns it as a geojson dict
+
+    Settings left as None are skipped. The size each map ends up with is in the build report, see build_all
+    """
+    with stage('geojson') as s:
+        if tolerance:
+            gdf = simplify_geometry(gdf, tolerance, shared_arcs)
+        if decimals is not None:
+            gdf = round_coordinates(gdf, decimals)
+        geojson = json.loads(gdf.to_json())
+
+        s.rows(geojson['features'])
+        return geojson
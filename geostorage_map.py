@@ -1,146 +1,182 @@
-from decimal import HAVE_CONTEXTVAR
-from requests import get
-import json
+import os
 import pandas as pd
-import geopandas as gpd
-import numpy as np
-import math
-import seaborn as sns
-import plotly.express as px
 import plotly.graph_objects as go
-from dash import Dash, dcc, html, Input, Output
-import os
+from basalt_geometry import basalt_zip_path, load_basalt
+from build_context import BuildContext
+from county_facts import select_facts
+from county_index import county_codes, geo_ids
+from dataset_catalog import read_dataset
+from figure_variants import colorbar_off_layout
+from geometry_prep import feature_subset
 
 # folder holding all forestry cdr data
-geostorage_path = 'data/geostorage'
-
-# data from census linking county name and fips
-county_fips_df = pd.read_csv('data/label_geography.csv', dtype={'geography':'str'})
-county_fips_df = county_fips_df[county_fips_df['geo_level']=='C']
-county_fips_df = county_fips_df.rename(columns={'label':'County, State', 'geography':'FIPS'})
-
-# get percentage of area in storage window
-geo_storage_area_df = pd.read_excel(f'{geostorage_path}/Counties_in_storage_2023Sept12.xlsx', dtype={'FIPS':str})
-geo_storage_area_df = geo_storage_area_df.rename(columns={'FIPS':'GEOID'})
-geo_storage_area_df['GEOID'] = geo_storage_area_df['GEOID'].apply(lambda x: str(x).zfill(5))
-geo_storage_area_df['Percentage'] = pd.to_numeric(geo_storage_area_df['Percentage'], errors='coerce')
-
-# geo storage potential
-geo_storage_cdr_df = pd.read_excel(f'{geostorage_path}/Storage cost per county data Edna.xlsx', dtype={'ST_CNTY_CODE':str})
-geo_storage_cdr_df = geo_storage_cdr_df.rename(columns={'ST_CNTY_CODE':'GEOID'})
-geo_storage_cdr_df['GEOID'] = geo_storage_cdr_df['GEOID'].apply(lambda x: str(x).zfill(5))
-geo_storage_cdr_df['GEO_ID'] = '0500000US' + geo_storage_cdr_df['GEOID']
-geo_storage_cdr_df['Ton CO2 per USD'] = geo_storage_cdr_df['StorageCost_USDperTonCO2']**-1
-geo_storage_cdr_df['Ton CO2 per USD per Area'] = geo_storage_cdr_df['Ton CO2 per USD'] / geo_storage_cdr_df['GIS_ACRES']
-geo_storage_cdr_df = geo_storage_cdr_df.dropna()
-# Rename cost to something pretty
-cost_col = 'Total Storage Cost (USD per Tonne CO2)'
-geo_storage_cdr_df = geo_storage_cdr_df.rename(columns={'StorageCost_USDperTonCO2':cost_col})
-
-# only use areas with >50% in storage window
-geo_storage_cdr_df = geo_storage_cdr_df.merge(geo_storage_area_df.loc[geo_storage_area_df['Percentage'] > 50], on='GEOID')
-
-# merge to get county state names
-geo_storage_cdr_df = geo_storage_cdr_df.merge(county_fips_df, left_on='GEOID', right_on='FIPS')
-
-print(geo_storage_cdr_df.columns)
-# geo json file
-from urllib.request import urlopen
-with urlopen('https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json') as response:
-    counties = json.load(response)
-
-# load basalt
-basalt_path = "data/Geostorage/Basalt.zip!/Basalt/basalt.shp"
-basalt_gdf = gpd.read_file(basalt_path)
-basalt_gdf = basalt_gdf.to_crs('WGS84')
-
-# split into several polygons
-exploded_basalt_gdf = basalt_gdf.explode()
-# get the exterior coordinatates of all polygons
-coord_seq = exploded_basalt_gdf.reset_index().geometry.apply(lambda poly: poly.exterior.coords)
-# get lata and lons
-lngs = [[coord[0] for coord in coords] for coords in coord_seq]
-lats = [[coord[1] for coord in coords] for coords in coord_seq]
-
-
-# make choropleth for soils map
-fig = go.Figure(go.Choropleth())
-fig.update_geos(scope='usa')
-
-# geostorage map only needs one trace
-fig.add_trace(trace=go.Choropleth(
-    geojson=counties,
-    locationmode="geojson-id",
-    locations=geo_storage_cdr_df['GEO_ID'],
-    featureidkey='properties.GEO_ID',
-    z=geo_storage_cdr_df[cost_col],
-    zmax=40, # geo_storage_cdr_df[cost_col].quantile(.95),
-    zmin=5.99,# geo_storage_cdr_df[cost_col].quantile(.05),
-    colorscale='greens_r',
-    customdata=geo_storage_cdr_df[['County, State', cost_col, 'Percentage']],
-    hovertemplate='<b>County</b>: %{customdata[0]}<br>' +
-                    '<b>Storage Cost</b>: %{customdata[1]:,.2f} USD per Tonne CO<sub>2</sub><br>' +
-                    '<b>Percent Land Area in Storage Window</b>: %{customdata[2]:,.1f}%<br>'
-                    '<extra></extra>'))
-
-for i, trace in enumerate(fig.data, 1):
-    trace.update(coloraxis=f"coloraxis{i}")
-    
-fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0},
-                  coloraxis2={"colorbar": {"x": 0.50, 
-                                           "len": 0.75, 
-                                           "y": -0.3,
-                                           'title':'USD per Tonne CO<sub>2</sub>',
-                                           'orientation':'h',
-                                           'titlefont':{'size':10},
-                                           'tickfont':{'size':10}
-                                           },
-                                'colorscale':'greens_r',
-                                'cmax':40,
-                                'cmin':5.99})
-
-# Add traces for basalt
-fig.add_trace(go.Choropleth(geojson=json.loads(basalt_gdf.geometry.to_json()),
-                               locations=[0],
-                               colorscale=[[0, '#FF7F7F'], [1, '#FF7F7F']],
-                               text='Basalt<br>Cost Unknown',
-                               hoverinfo='text',
-                               showscale=False,
-                               z=[1]))
-"""
-for lng, lat in zip(lngs, lats):
-    fig.add_trace(go.Scattergeo(lat=lat, 
-                                 lon=lng, 
-                                 mode='lines', 
-                                 fill='toself',
-                                 line = {'color': '#FF7F7F',
-                                         # 'alpha': 0.6
-                                       },
-                                hoverinfo = 'text',
-                                text = 'Basalt<br>Cost Unknown',
-                                name = 'Basalt',
-                                legendgroup = 'Basalt',
-                                showlegend = 'Basalt' not in {d.name for d in fig.data}))
-"""
-# Fake trace to showlegend for basalt
-fig.add_trace(go.Scattergeo(
-                            lon=[None],
-                            lat=[None],
-                            mode="lines",
-                            name="Basalt (Cost Unknown)",
-                            line=dict(color="#FF7F7F"),
-                            )
-                )
-fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
-fig.update_coloraxes(colorbar_title_side='top')
-fig.write_html('chapter_maps/geostorage_map.html')
-
-# save version with no color bars
-for i in range(len(fig.data)):
-    fig.update_layout({f'coloraxis{i+1}':{'showscale':False}})
-
-fig.show()
-fig.write_html('chapter_maps/geostorage_map_nocbar.html')
+geostorage_path = 'data/Geostorage'
 
+# name of the html file written to chapter_maps
+output_name = 'geostorage_map'
 
+# simplification and rounding of the county polygons embedded in this map, see geometry_prep
+geometry_settings = {'resolution': '20m', 'tolerance': 0.005, 'decimals': 3}
+
+# Rename cost to something pretty
+cost_col = 'Total Storage Cost (USD per Tonne CO2)'
 
+# simplification and rounding of the basalt overlay, see basalt_geometry
+basalt_geometry_settings = {'tolerance': 0.005, 'decimals': 3}
+
+# files this map is built from. The map is only rebuilt when one of these, or the code, changes
+inputs = [f'{geostorage_path}/Counties_in_storage_2023Sept12.xlsx',
+          f'{geostorage_path}/Storage cost per county data Edna.xlsx',
+          basalt_zip_path,
+          'data/cb_2018_us_county_20m.zip']
+
+# columns this map adds to the county fact table, label: fact column
+fact_columns = {cost_col: 'storage_cost',
+                'Ton CO2 per USD': 'storage_per_usd',
+                'Percentage': 'storage_window_pct'}
+
+def read_facts():
+    """
+    Reads storage cost and storage window area data and returns the counties with >50% area in the storage window
+    """
+    # get percentage of area in storage window
+    geo_storage_area_df = read_dataset(f'{geostorage_path}/Counties_in_storage_2023Sept12.xlsx', columns=['FIPS', 'Percentage'], dtype={'FIPS':str})
+    geo_storage_area_df['county_code'] = county_codes(geo_storage_area_df['FIPS'])
+    geo_storage_area_df['Percentage'] = pd.to_numeric(geo_storage_area_df['Percentage'], errors='coerce')
+
+    # geo storage potential
+    # all columns are kept, dropna below drops rows with a gap in any of them
+    geo_storage_cdr_df = read_dataset(f'{geostorage_path}/Storage cost per county data Edna.xlsx', dtype={'ST_CNTY_CODE':str})
+    geo_storage_cdr_df['county_code'] = county_codes(geo_storage_cdr_df['ST_CNTY_CODE'])
+    geo_storage_cdr_df['Ton CO2 per USD'] = geo_storage_cdr_df['StorageCost_USDperTonCO2']**-1
+    geo_storage_cdr_df['Ton CO2 per USD per Area'] = geo_storage_cdr_df['Ton CO2 per USD'] / geo_storage_cdr_df['GIS_ACRES']
+    geo_storage_cdr_df = geo_storage_cdr_df.dropna()
+    geo_storage_cdr_df = geo_storage_cdr_df.rename(columns={'StorageCost_USDperTonCO2':cost_col})
+
+    # only use areas with >50% in storage window
+    geo_storage_cdr_df = geo_storage_cdr_df.merge(geo_storage_area_df.loc[geo_storage_area_df['Percentage'] > 50, ['county_code', 'Percentage']], on='county_code')
+    return geo_storage_cdr_df
+
+def load_geostorage(context):
+    """
+    Returns the storage columns of the county fact table for the counties in the storage window, with county names
+    """
+    return select_facts(context.county_facts, fact_columns)
+
+def views(context):
+    """
+    Returns the metrics the map app can switch between, as new z values and color axis settings
+    """
+    geo_storage_cdr_df = load_geostorage(context)
+    per_usd = geo_storage_cdr_df['Ton CO2 per USD']
+    # trace 0 is the empty choropleth, the storage trace is trace 1 on color axis 2
+    return {'Storage Cost': {'data': {1: {'z': geo_storage_cdr_df[cost_col].tolist()}},
+                             'layout': {('coloraxis2', 'cmax'): 40,
+                                        ('coloraxis2', 'cmin'): 5.99,
+                                        ('coloraxis2', 'colorscale'): 'greens_r',
+                                        ('coloraxis2', 'colorbar', 'title', 'text'): 'USD per Tonne CO<sub>2</sub>'}},
+            'Storage per Dollar': {'data': {1: {'z': per_usd.tolist()}},
+                                   'layout': {('coloraxis2', 'cmax'): per_usd.quantile(.98),
+                                              ('coloraxis2', 'cmin'): per_usd.quantile(.02),
+                                              ('coloraxis2', 'colorscale'): 'greens',
+                                              ('coloraxis2', 'colorbar', 'title', 'text'): 'Tonnes CO<sub>2</sub> Stored per USD'}}}
+
+def make_figure(context):
+    """
+    Builds the geostorage chapter map
+    """
+    geo_storage_cdr_df = load_geostorage(context)
+
+    # geo json file. Built from the bundled census shapefile and cached locally
+    counties = context.counties(**geometry_settings)
+
+    # reprojected, simplified and cached by basalt_geometry. Left out of the map when Basalt.zip is missing,
+    # like the basalt tile layer
+    basalt = load_basalt(**basalt_geometry_settings) if os.path.exists(basalt_zip_path) else None
+
+    # make choropleth for soils map
+    fig = go.Figure(go.Choropleth())
+    fig.update_geos(scope='usa')
+
+    # geostorage map only needs one trace, and only the counties it colors
+    locations = geo_ids(geo_storage_cdr_df['county_code'])
+    fig.add_trace(trace=go.Choropleth(
+        geojson=feature_subset(counties, locations, 'properties.GEO_ID'),
+        locationmode="geojson-id",
+        locations=locations,
+        featureidkey='properties.GEO_ID',
+        z=geo_storage_cdr_df[cost_col],
+        zmax=40, # geo_storage_cdr_df[cost_col].quantile(.95),
+        zmin=5.99,# geo_storage_cdr_df[cost_col].quantile(.05),
+        colorscale='greens_r',
+        customdata=geo_storage_cdr_df[['County, State', cost_col, 'Percentage']],
+        hovertemplate='<b>County</b>: %{customdata[0]}<br>' +
+                        '<b>Storage Cost</b>: %{customdata[1]:,.2f} USD per Tonne CO<sub>2</sub><br>' +
+                        '<b>Percent Land Area in Storage Window</b>: %{customdata[2]:,.1f}%<br>'
+                        '<extra></extra>'))
+
+    for i, trace in enumerate(fig.data, 1):
+        trace.update(coloraxis=f"coloraxis{i}")
+
+    fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0},
+                      coloraxis2={"colorbar": {"x": 0.50,
+                                               "len": 0.75,
+                                               "y": -0.3,
+                                               'title':'USD per Tonne CO<sub>2</sub>',
+                                               'orientation':'h',
+                                               'titlefont':{'size':10},
+                                               'tickfont':{'size':10}
+                                               },
+                                    'colorscale':'greens_r',
+                                    'cmax':40,
+                                    'cmin':5.99})
+
+    if basalt is not None:
+        # Add traces for basalt
+        fig.add_trace(go.Choropleth(geojson=basalt['geojson'],
+                                       locations=[0],
+                                       colorscale=[[0, '#FF7F7F'], [1, '#FF7F7F']],
+                                       text='Basalt<br>Cost Unknown',
+                                       hoverinfo='text',
+                                       showscale=False,
+                                       z=[1]))
+        """
+        # outlines of every basalt polygon in one trace, separated by None
+        fig.add_trace(go.Scattergeo(lat=basalt['lat'],
+                                         lon=basalt['lon'],
+                                         mode='lines',
+                                         fill='toself',
+                                         line = {'color': '#FF7F7F',
+                                                 # 'alpha': 0.6
+                                               },
+                                        hoverinfo = 'text',
+                                        text = 'Basalt<br>Cost Unknown',
+                                        name = 'Basalt',
+                                        legendgroup = 'Basalt',
+                                        showlegend = 'Basalt' not in {d.name for d in fig.data}))
+        """
+        # Fake trace to showlegend for basalt
+        fig.add_trace(go.Scattergeo(
+                                    lon=[None],
+                                    lat=[None],
+                                    mode="lines",
+                                    name="Basalt (Cost Unknown)",
+                                    line=dict(color="#FF7F7F"),
+                                    )
+                        )
+    fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
+    fig.update_coloraxes(colorbar_title_side='top')
+    return fig
+
+def build(context):
+    """
+    Writes the geostorage map and its no color bar version to the output folder
+    """
+    fig = make_figure(context)
+    # save version with no cbar. Only the layout differs, so it shares the figure data with the main map
+    context.write_map(fig, output_name, variants={'nocbar': colorbar_off_layout(fig)})
+    return fig
+
+if __name__ == '__main__':
+    fig = build(BuildContext())
+    fig.show()
@@ -0,0 +1,89 @@
+import argparse
+import subprocess
+import sys
+
+# Measures how long importing each entry point takes with python -X importtime, in a fresh interpreter each time,
+# and fails when one goes over its budget. A single map rebuild from the cache should spend its time building,
+# not importing, so geometry libraries are only imported when geometry is built (see lazy_imports) and GUI
+# toolkits, which break on headless build machines, are never imported at all
+
+# seconds allowed for importing each entry point, the fastest of --repeat imports is compared with it
+budgets = {
+    'build_all': 1.5,
+    'benchmark': 1.5,
+    'bicrs_map': 1.5,
+    'dac_map': 1.5,
+    'eeej_map': 1.5,
+    'forestry_map': 1.5,
+    'geostorage_map': 1.5,
+    'region_map': 1.5,
+    'soils_map_v2': 1.5,
+    'static_export': 1.5,
+    'vector_tiles': 2.0,
+    'map_app': 2.5,
+}
+
+# modules no entry point may import when it is imported
+never_imported = ['tkinter', 'turtle', 'seaborn', 'geopandas', 'shapely']
+
+def import_times(module):
+    """
+    Imports module in a fresh interpreter and returns a dict of every module it imported to
+    (level, cumulative seconds), level 0 being module itself
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'importing {module} failed:\n{result.stderr}')
+    # a module's imports are listed before it, so everything since the last top level import belongs to it.
+    # Whatever the interpreter imports on startup is left out
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = (level, int(cumulative) / 1e6)
+        if level == 0:
+            if name.strip() == module:
+                return times
+            times = {}
+    raise RuntimeError(f'no import time reported for {module}')
+
+def check_module(module, repeat=3):
+    """
+    Returns the fastest import time of module, its slowest direct imports and the never_imported modules it imported
+    """
+    runs = [import_times(module) for _ in range(repeat)]
+    fastest = min(runs, key=lambda times: times[module][1])
+    direct = sorted(((seconds, name) for name, (level, seconds) in fastest.items() if level == 1), reverse=True)
+    imported = {name.split('.')[0] for name in fastest}
+    return {'seconds': fastest[module][1],
+            'slowest': [(name, seconds) for seconds, name in direct[:5]],
+            'unwanted': [name for name in never_imported if name in imported]}
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import time of every entry point against its budget')
+    parser.add_argument('modules', nargs='*', help=f'only check these entry points, any of: {", ".join(budgets)}')
+    parser.add_argument('--repeat', type=int, default=3, help='import each entry point this many times and keep the fastest')
+    args = parser.parse_args()
+    unknown = set(args.modules) - set(budgets)
+    if unknown:
+        parser.error(f'unknown entry points: {", ".join(sorted(unknown))}')
+
+    failures = []
+    print(f'{"entry point":<16}{"import s":>10}{"budget s":>10}  slowest imports')
+    for module in args.modules or budgets:
+        result = check_module(module, args.repeat)
+        slowest = ', '.join(f'{name} {seconds:.2f}' for name, seconds in result['slowest'])
+        print(f'{module:<16}{result["seconds"]:>10.3f}{budgets[module]:>10.2f}  {slowest}')
+        if result['seconds'] > budgets[module]:
+            failures.append(f'{module} takes {result["seconds"]:.2f} s to import, its budget is {budgets[module]:.2f} s')
+        if result['unwanted']:
+            failures.append(f'{module} imports {", ".join(result["unwanted"])}')
+    for message in failures:
+        print(f'Over budget: {message}')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import importlib
+from build_profile import stage
+
+# geopandas and shapely take a second or more to import and most builds never need them, the county, region,
+# basalt and network geometry is normally read back from the cache as json. Modules that only need them inside
+# functions import them with lazy_module, so the import happens the first time the geometry is actually built.
+# The import is recorded as its own 'import' stage
+
+class LazyModule:
+    """
+    Stands in for a module and imports it the first time one of its attributes is used
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            with stage('import'):
+                self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = 'imported' if self._module is not None else 'not imported yet'
+        return f'<lazy module {self._name!r}, {state}>'
+
+def lazy_module(name):
+    """
+    Takes a module name and returns a LazyModule for it, e.g. gpd = lazy_module('geopandas')
+    """
+    return LazyModule(name)
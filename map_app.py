@@ -0,0 +1,92 @@
+import argparse
+import importlib
+from dash import Dash, Input, Output, Patch, State, dcc, html
+from build_all import map_modules
+from build_context import BuildContext
+from network_layers import add_network_layers, network_layers
+
+# Serves every chapter map from one Dash app. A map's figure, geometry included, is sent once when it is picked.
+# Switching between its views (metrics, methods or scenarios) then only sends a Patch of the changed z and
+# customdata, plus any color axis settings, instead of a whole new figure
+
+class MapStore:
+    """
+    Builds each map's figure and views the first time they are asked for and keeps them for the next request
+    """
+    def __init__(self, context):
+        self.context = context
+        self._figures = {}
+        self._views = {}
+
+    def figure(self, name):
+        if name not in self._figures:
+            fig = importlib.import_module(name).make_figure(self.context)
+            if self.context.layers:
+                add_network_layers(fig, self.context.networks())
+            self._figures[name] = fig
+        return self._figures[name]
+
+    def views(self, name):
+        """
+        Dict of view label to a dict of 'data' (trace index to trace properties) and 'layout' (path tuple to value)
+
+        Maps without a views function have a single view, the figure as drawn
+        """
+        if name not in self._views:
+            module = importlib.import_module(name)
+            self._views[name] = module.views(self.context) if hasattr(module, 'views') else {'Map': {}}
+        return self._views[name]
+
+def view_patch(view):
+    """
+    Takes a view and returns the dash Patch that turns the figure into it
+    """
+    patch = Patch()
+    for i, trace in view.get('data', {}).items():
+        for key, value in trace.items():
+            patch['data'][i][key] = value
+    for path, value in view.get('layout', {}).items():
+        target = patch['layout']
+        for key in path[:-1]:
+            target = target[key]
+        target[path[-1]] = value
+    return patch
+
+def make_app(context=None):
+    """
+    Returns the Dash app, with a map picker, a view picker and the map itself
+    """
+    store = MapStore(context or BuildContext())
+    app = Dash(__name__, title='Roads to Removal maps')
+    app.layout = html.Div([
+        html.Div([dcc.Dropdown(id='map', options=map_modules, value=map_modules[0], clearable=False,
+                               style={'width': '250px'}),
+                  dcc.Dropdown(id='view', clearable=False, style={'width': '300px'})],
+                 style={'display': 'flex', 'gap': '10px'}),
+        dcc.Graph(id='figure', style={'height': '90vh'}),
+    ])
+
+    @app.callback(Output('figure', 'figure'), Output('view', 'options'), Output('view', 'value'),
+                  Input('map', 'value'))
+    def show_map(name):
+        views = store.views(name)
+        return store.figure(name), list(views), next(iter(views))
+
+    @app.callback(Output('figure', 'figure', allow_duplicate=True),
+                  Input('view', 'value'), State('map', 'value'), prevent_initial_call=True)
+    def show_view(label, name):
+        return view_patch(store.views(name)[label])
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve all chapter maps from one Dash app')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--debug', action='store_true')
+    parser.add_argument('--layers', nargs='+', choices=list(network_layers), default=[],
+                        help='draw these pipeline, road, waterway or transloading networks over every map')
+    args = parser.parse_args()
+    make_app(BuildContext(layers=args.layers)).run(port=args.port, debug=args.debug)
+
+if __name__ == '__main__':
+    main()
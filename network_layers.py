@@ -0,0 +1,110 @@
+import plotly.graph_objects as go
+from build_profile import stage
+from build_cache import sources_key, cache_path, cached_json
+from geometry_prep import line_coordinates, round_coordinates, simplify_geometry
+from lazy_imports import lazy_module
+
+gpd = lazy_module('geopandas')
+
+# Pipeline, road, waterway and transloading networks that can be drawn over any chapter map.
+# Each layer is split into one trace per value of its group_by attribute, with every line of a group joined
+# into that one trace, so the trace count stays at a handful however many lines a network has
+lineshapes_path = 'data/Geostorage/Lineshapes/CH5 data'
+
+# code the cached network groups are built with, part of their cache key
+builder_modules = [__file__, 'geometry_prep.py']
+
+network_layers = {
+    'pipelines': {'name': 'CO<sub>2</sub> Pipelines',
+                  'path': f'{lineshapes_path}/Pipelines.zip',
+                  'shapefile': 'Pipelines/Pipelines_RoadsToRemoval_2023Jan31.shp',
+                  'group_by': 'Existing',
+                  'groups': {'Yes': 'Existing', 'No': 'Planned'},
+                  'mode': 'lines',
+                  'style': {'color': '#404040', 'width': 2}},
+    'roads': {'name': 'Freeways',
+              'path': f'{lineshapes_path}/Roads.zip',
+              'shapefile': 'Roads/USA_freeways.shp',
+              'mode': 'lines',
+              'style': {'color': '#8c8c8c', 'width': 1}},
+    'waterways': {'name': 'Waterways',
+                  'path': f'{lineshapes_path}/Waterways.zip',
+                  'shapefile': 'Waterways/CNW_NAD83_V5_2019.shp',
+                  'mode': 'lines',
+                  'style': {'color': '#3182c1', 'width': 1}},
+    'transloading_biomass': {'name': 'Biomass Transloading',
+                             'path': f'{lineshapes_path}/TransloadingBiomass.zip',
+                             'shapefile': 'TransloadingBiomass/FTOT.shp',
+                             'mode': 'markers',
+                             'style': {'color': '#703b9b', 'size': 3}},
+    'transloading_co2': {'name': 'CO<sub>2</sub> Transloading',
+                         'path': f'{lineshapes_path}/TransloadingCO2.zip',
+                         'shapefile': 'TransloadingCO2/TOFC.shp',
+                         'mode': 'markers',
+                         'style': {'color': '#e58f17', 'size': 4}},
+}
+
+# simplification and rounding of the network lines, see geometry_prep
+default_network_settings = {'tolerance': 0.01, 'decimals': 3}
+
+@stage('ingest')
+def read_network(layer):
+    """
+    Reads a network shapefile from its zip and reprojects it to WGS84
+    """
+    network_gdf = gpd.read_file(f'{layer["path"]}!{layer["shapefile"]}')
+    return network_gdf.to_crs('WGS84')
+
+def build_network(name, tolerance=None, decimals=None):
+    """
+    Takes a layer name and returns a list of its groups, each a dict of group label and lon/lat lists
+    """
+    layer = network_layers[name]
+    network_gdf = read_network(layer)
+    group_by = layer.get('group_by')
+    network_gdf['group'] = network_gdf[group_by].astype(str) if group_by else ''
+
+    # points are left as they are
+    if tolerance and layer['mode'] == 'lines':
+        network_gdf = simplify_geometry(network_gdf, tolerance)
+    if decimals is not None:
+        network_gdf = round_coordinates(network_gdf, decimals)
+
+    groups = []
+    for group, group_gdf in network_gdf.groupby('group', sort=True):
+        lons, lats = line_coordinates(group_gdf.geometry.to_numpy())
+        groups.append({'group': layer.get('groups', {}).get(group, group), 'lon': lons, 'lat': lats})
+    return groups
+
+def load_network(name, tolerance=None, decimals=None):
+    """
+    Returns the groups of a network layer, cached until its zip, the code building it or the settings change
+    """
+    path = cache_path(f'network_{name}', sources_key([network_layers[name]['path'], *builder_modules], tolerance, decimals), 'json')
+    return cached_json(path, lambda: build_network(name, tolerance, decimals))
+
+def network_traces(name, groups):
+    """
+    Takes a layer name and its loaded groups and returns one Scattergeo trace per group
+    """
+    layer = network_layers[name]
+    traces = []
+    for group in groups:
+        trace_name = f'{layer["name"]} ({group["group"]})' if group['group'] else layer['name']
+        style = {'line': layer['style']} if layer['mode'] == 'lines' else {'marker': layer['style']}
+        traces.append(go.Scattergeo(lon=group['lon'],
+                                    lat=group['lat'],
+                                    mode=layer['mode'],
+                                    name=trace_name,
+                                    legendgroup=name,
+                                    hoverinfo='name',
+                                    **style))
+    return traces
+
+def add_network_layers(fig, networks):
+    """
+    Takes a figure and a dict of layer name to loaded groups and draws each layer on top of the figure
+    """
+    for name, groups in networks.items():
+        fig.add_traces(network_traces(name, groups))
+    return fig
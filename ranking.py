@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+# Ranks the columns of a numeric df row by row, e.g. the best CDR method in each region or county.
+# Works on the underlying numpy array so it stays fast with many methods and scenarios
+
+def top_k(df, k=2):
+    """
+    Takes a numeric df and returns the k highest columns of every row
+
+    The result has one row per row of df with method1..methodk (column labels, None when the row has fewer
+    than that many values), value1..valuek and tie, True when more than one column shares the top value.
+    NaNs are never ranked, and ties are broken by column order like idxmax
+    """
+    values = df.to_numpy(dtype=float)
+    n_cols = values.shape[1]
+    k = min(k, n_cols)
+    # NaNs go to the bottom of every row
+    ranked = np.where(np.isnan(values), -np.inf, values)
+
+    # a stable sort keeps equal values in column order, so ties match idxmax
+    top = np.argsort(-ranked, axis=1, kind='stable')[:, :k]
+    top_values = np.take_along_axis(values, top, axis=1)
+
+    # object array of column labels. Filled one by one so MultiIndex tuples stay whole
+    labels = np.empty(n_cols, dtype=object)
+    for i, column in enumerate(df.columns):
+        labels[i] = column
+    top_labels = np.where(np.isnan(top_values), None, labels[top])
+
+    ranks = {}
+    for i in range(k):
+        ranks[f'method{i + 1}'] = top_labels[:, i]
+        ranks[f'value{i + 1}'] = top_values[:, i]
+    best = np.take_along_axis(ranked, top[:, :1], axis=1)[:, 0]
+    ranks['tie'] = np.isfinite(best) & ((ranked == best[:, None]).sum(axis=1) > 1)
+    return pd.DataFrame(ranks, index=df.index)
@@ -0,0 +1,68 @@
+import pandas as pd
+from build_cache import cached_frame
+from build_profile import stage
+from county_index import county_codes
+
+# reference data shared by every chapter map
+label_geography_path = 'data/label_geography.csv'
+regions_svi_path = 'data/Regions and SVI.xlsx'
+
+# code the readers here run, this file and the county code parser
+reader_modules = [__file__, 'county_index.py']
+
+def read_county_fips():
+    """
+    Reads the census county labels and returns one row per county
+
+    county_code is the integer county key used for joins, FIPS the zero padded 5 digit code, GEO_ID matches
+    the county geojson and State is categorical
+    """
+    county_fips_df = pd.read_csv(label_geography_path, dtype={'geography':'str'})
+    county_fips_df = county_fips_df[county_fips_df['geo_level']=='C']
+    county_fips_df = county_fips_df.rename(columns={'label':'County, State', 'geography':'FIPS'})
+    county_fips_df['FIPS'] = county_fips_df['FIPS'].str.zfill(5)
+    county_fips_df['GEO_ID'] = '0500000US' + county_fips_df['FIPS']
+    county_fips_df['State'] = county_fips_df['County, State'].str.rsplit(', ', n=1).str[-1].astype('category')
+    county_fips_df['county_code'] = county_codes(county_fips_df['FIPS'])
+    return county_fips_df[['county_code', 'FIPS', 'County, State', 'State', 'GEO_ID']].reset_index(drop=True)
+
+def read_region_mapping():
+    """
+    Reads the County_Region_Mapping sheet with zero padded FIPS and GEOID, an integer county_code and a categorical Region
+    """
+    regions_df = pd.read_excel(regions_svi_path, sheet_name='County_Region_Mapping', dtype={'FIPS': str, 'GEOID':str})
+    regions_df['GEOID'] = regions_df['GEOID'].str.zfill(5)
+    regions_df['FIPS'] = regions_df['FIPS'].str.zfill(5)
+    regions_df['county_code'] = county_codes(regions_df['FIPS'])
+    regions_df['Region'] = regions_df['Region'].astype('category')
+    return regions_df
+
+def read_region_colors():
+    """
+    Reads the RGB sheet and adds '#' hex colors and plotly 'rgb(r, g, b)' strings for each region
+    """
+    colors_df = pd.read_excel(regions_svi_path, sheet_name='RGB', dtype={'Hex Color #': str})
+    colors_df['Hex Color #'] = '#' + colors_df['Hex Color #']
+    colors_df['RGB'] = 'rgb(' + colors_df['R'].astype(str) + ', ' + colors_df['G'].astype(str) + ', ' + colors_df['B'].astype(str) + ')'
+    return colors_df
+
+@stage('ingest')
+def load_county_fips():
+    """
+    Returns the county label df, parsing label_geography.csv only when it or this reader has changed
+    """
+    return cached_frame('county_fips', [label_geography_path, *reader_modules], read_county_fips)
+
+@stage('ingest')
+def load_region_mapping():
+    """
+    Returns the county to region mapping, parsing the spreadsheet only when it or this reader has changed
+    """
+    return cached_frame('region_mapping', [regions_svi_path, *reader_modules], read_region_mapping)
+
+@stage('ingest')
+def load_region_colors():
+    """
+    Returns the region colors, parsing the spreadsheet only when it or this reader has changed
+    """
+    return cached_frame('region_colors', [regions_svi_path, *reader_modules], read_region_colors)
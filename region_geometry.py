@@ -0,0 +1,67 @@
+import hashlib
+import os
+import pandas as pd
+from build_profile import stage
+from build_cache import sources_key, cache_path, cached_json, write_atomically
+from county_index import county_codes
+from county_geometry import counties_zip_path, load_counties_gdf
+from geometry_prep import prepare_geometry
+from reference_data import load_region_mapping
+from lazy_imports import lazy_module
+
+gpd = lazy_module('geopandas')
+
+# code the cached region polygons are built with, part of their cache key
+builder_modules = [__file__, 'county_geometry.py', 'county_index.py', 'geometry_prep.py']
+
+def region_mapping_hash(regions_df):
+    """
+    Returns a hash of just the county to region assignments, so edits elsewhere in Regions and SVI.xlsx
+    don't invalidate the region polygons
+    """
+    values = pd.util.hash_pandas_object(regions_df[['county_code', 'Region']].astype(str), index=False).values
+    return hashlib.sha256(values.tobytes()).hexdigest()[:16]
+
+def dissolve_regions(resolution='5m', regions_df=None):
+    """
+    Merges the census counties with their region and unions them into one polygon per region
+    """
+    regions_df = load_region_mapping() if regions_df is None else regions_df
+    census_gdf = load_counties_gdf(resolution)
+    census_gdf['county_code'] = county_codes(census_gdf['GEOID'])
+    with stage('join') as s:
+        census_gdf = census_gdf.merge(regions_df[['county_code', 'Region']], on='county_code')
+        census_gdf['Region'] = census_gdf['Region'].astype(str)
+        s.rows(census_gdf)
+    with stage('dissolve') as s:
+        return s.rows(census_gdf[['Region', 'geometry']].dissolve(by='Region'))
+
+def regions_key(resolution, regions_df, *settings):
+    zip_path = counties_zip_path.format(resolution=resolution)
+    return f'{resolution}_{sources_key([zip_path, *builder_modules], region_mapping_hash(regions_df), *settings)}'
+
+def load_regions_gdf(resolution='5m', regions_df=None):
+    """
+    Returns one polygon per region, indexed by Region
+
+    The dissolve only runs when the county shapefile, the region assignments or the code building them change.
+    The result is cached as GeoParquet keyed on those and the resolution
+    """
+    regions_df = load_region_mapping() if regions_df is None else regions_df
+    path = cache_path('regions', regions_key(resolution, regions_df), 'parquet')
+    if os.path.exists(path):
+        return gpd.read_parquet(path)
+
+    regions_gdf = dissolve_regions(resolution, regions_df)
+    write_atomically(path, regions_gdf.to_parquet)
+    return regions_gdf
+
+def load_regions(resolution='5m', tolerance=None, decimals=None, shared_arcs=False, regions_df=None):
+    """
+    Returns the region polygons as a geojson dict with the region name as each feature id, simplified and
+    rounded by geometry_prep. Cached per resolution and settings
+    """
+    regions_df = load_region_mapping() if regions_df is None else regions_df
+    path = cache_path('regions', regions_key(resolution, regions_df, tolerance, decimals, shared_arcs), 'json')
+    return cached_json(path, lambda: prepare_geometry(load_regions_gdf(resolution, regions_df),
+                                                      tolerance, decimals, shared_arcs))
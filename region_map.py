@@ -1,40 +1,22 @@
-from heapq import merge
-from pydoc import ErrorDuringImport
-from turtle import color
-from wsgiref.util import shift_path_info
-from requests import get
-import json
 import pandas as pd
-import geopandas as gpd
-import numpy as np
-import math
-import seaborn as sns
-import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from dash import Dash, dcc, html, Input, Output
-import os
-import random
+from build_context import BuildContext
+from dataset_catalog import read_dataset
+from ranking import top_k
 
 # folder holding all forestry cdr data
 regions_path = 'data/Regional Analysis'
 
-# data from census linking county name and fips
-county_fips_df = pd.read_csv('data/label_geography.csv', dtype={'geography':'str'})
-county_fips_df = county_fips_df[county_fips_df['geo_level']=='C']
-county_fips_df = county_fips_df.rename(columns={'label':'County, State', 'geography':'FIPS'})
-county_fips_df['GEO_ID'] = '0500000US' + county_fips_df['FIPS']
+# name of the html file written to chapter_maps
+output_name = 'regional_map'
 
-# map county names to regions
-regions_df = pd.read_excel('data/Regions and SVI.xlsx', sheet_name='County_Region_Mapping', dtype={'FIPS': str, 'GEOID':str})
-regions_df['GEOID'] = regions_df['GEOID'].apply(lambda x: str(x).zfill(5))
-regions_df['FIPS'] = regions_df['FIPS'].apply(lambda x: str(x).zfill(5))
+# simplification and rounding of the dissolved region polygons, see geometry_prep
+region_geometry_settings = {'resolution': '5m', 'tolerance': 0.01, 'decimals': 3}
 
-# colors for regions
-colors_df = pd.read_excel('data/Regions and SVI.xlsx', sheet_name='RGB', dtype={'Hex Color #': str})
-colors_df['Hex Color #'] = '#' + colors_df['Hex Color #']
-colors_df['RGB'] = colors_df.apply(lambda row: f"rgb({row['R']}, {row['G']}, {row['B']})", axis=1)
-colors_set = colors_df['RGB'].to_list()
+# files this map is built from. The map is only rebuilt when one of these, or the code, changes
+inputs = [f'{regions_path}/R2R Regions - Summary Table.csv',
+          'data/Regions and SVI.xlsx',
+          'data/cb_2018_us_county_5m.zip']
 
 # copy pasta from https://towardsdatascience.com/discrete-colour-scale-in-plotly-python-26f2d6e21c77
 def generateDiscreteColourScale(colour_set):
@@ -56,22 +38,6 @@ def generateDiscreteColourScale(colour_set):
     colour_output[-1]=(1,colour_output[-1][1])
     return colour_output
 
-colors = generateDiscreteColourScale(colors_set)
-
-# read file taken from census. This should have Oglala 
-counties_path = 'data/cb_2018_us_county_5m.zip!cb_2018_us_county_5m.shp'
-census_gdf = gpd.read_file(counties_path)
-
-# merge them together
-census_gdf = census_gdf.merge(regions_df, left_on='GEOID', right_on='FIPS')
-
-# combine regions into one polygon
-regions_gdf = census_gdf[['Region', 'geometry']].dissolve(by='Region')
-
-# read regions data
-regions_path = 'data/Regional Analysis'
-regions_df = pd.read_csv(f'{regions_path}/R2R Regions - Summary Table.csv', header=[0,1,2], index_col=0)
-
 # loop through each method and process data
 idx = pd.IndexSlice
 
@@ -96,28 +62,29 @@ idx = pd.IndexSlice
 #     return df
 
 def find_top_two(regions_df):
-    max1=regions_df.max(axis=1)
-    maxcolum1=regions_df.idxmax(axis=1)
-    
-    max2 = regions_df.replace(np.array(regions_df.max(axis=1)),0).max(axis=1)
-    maxcolum2=regions_df.replace(np.array(regions_df.max(axis=1)),0).idxmax(axis=1)
-    
-    return pd.DataFrame({ 'max1': max1, 'max2': max2 ,'maxcol1':maxcolum1,'maxcol2':maxcolum2 })
+    """
+    Takes the regional summary df and returns the top two methods of each region with their values
 
-# get list of unique methods + their units
-methods_units = regions_df.columns.droplevel(-1).unique()
-# create list of dfs for each cdr method
-#methods_dfs = [process_regional_methods(regions_df, method, unit) for method, unit in methods_units] # {(a, b) for a, b, c in regions_df.columns}]
+    maxcol2 is None for a region with fewer than two methods
+    """
+    ranks = top_k(regions_df, k=2).drop(columns='tie')
+    return ranks.rename(columns={'value1': 'max1', 'value2': 'max2', 'method1': 'maxcol1', 'method2': 'maxcol2'})
 
-#create new data frame with top 2 methods for each region
-regions_top2_df = find_top_two(regions_df)
+def load_regions_summary():
+    """
+    Reads the regional summary table and finds the top two methods in each region
+    """
+    # read regions data
+    regions_df = read_dataset(f'{regions_path}/R2R Regions - Summary Table.csv', header=[0,1,2], index_col=0)
 
+    #create new data frame with top 2 methods for each region
+    return find_top_two(regions_df)
 
-def make_choro_trace(df, region, color_scale='Rainbow'):
+def make_choro_trace(df, regions_geojson, color_scale='Rainbow'):
     """
-    Takes a df and returns a plotly GO choropleth object
+    Takes the top two methods df and returns a single plotly GO choropleth object covering every region
 
-    trace_count is the index of the trace. It sets the first trace to visible, and the rest not visible
+    All regions share the one serialized regions_geojson, so the polygons are only embedded in the html once
     """
     # # Get CDR method
     # method = df.columns.get_level_values(0)[0]
@@ -148,73 +115,84 @@ def make_choro_trace(df, region, color_scale='Rainbow'):
     # )
     # Add region names back into dataframe
     df['Region'] = df.index
-    df['Count'] = 1 # range(len(df)) # random.sample(range(len(df)), len(df))
-    print(df.columns)
-    print(df.loc[region, ['Region', 'maxcol1', 'maxcol2']])
 
-    max1 = df.loc[region, 'maxcol1']
-    max2 = df.loc[region, 'maxcol2']
-    
-    customdata= [region, max1, max2] #df.loc[region, ['Region', 'maxcol1', 'maxcol2']].T,
-    str1 = f'{customdata[1][0]} {customdata[1][2]}'
-    str2 = f'{customdata[2][0]} {customdata[2][2]}'
+    # tooltip text for the top two methods. Should be: Method Submethod, or blank for a region without that many
+    str1 = [f'{col[0]} {col[2]}' if col is not None else '' for col in df['maxcol1']]
+    str2 = [f'{col[0]} {col[2]}' if col is not None else '' for col in df['maxcol2']]
 
+    # one trace for all regions. Each region gets its own band of the discrete color scale
     trace = go.Choropleth(
-                        geojson=json.loads(regions_gdf.geometry.to_json()),
+                        geojson=regions_geojson,
                         locationmode="geojson-id",
-                        locations=[region],
+                        locations=df['Region'],
                         # featureidkey='properties.GEO_ID',
-                        z=[1],
-                        zauto=True,
+                        z=list(range(len(df))),
+                        zmin=-0.5,
+                        zmax=len(df) - 0.5,
                         
                         #coloraxis='coloraxis',
                         colorscale=color_scale,
-                        customdata= [[region, max1, max2],], #df.loc[region, ['Region', 'maxcol1', 'maxcol2']].T,
+                        customdata=[[region, s1, s2] for region, s1, s2 in zip(df['Region'], str1, str2)],
                         hovertemplate=  '<b>Region</b>: %{customdata[0]}<br>' +
                                         '<b>Top Two Methods: <b><br>' +
-                                         str1 +
-                                         '<br>' +
-                                         str2 +
+                                        '%{customdata[1]}' +
+                                        '<br>' +
+                                        '%{customdata[2]}' +
                                         '<extra></extra>')
     return trace
 
-fig = go.Figure()
-
-# make plots
-# for i, df in enumerate(methods_dfs):
-#     fig.add_trace(make_choro_trace(df, i))
-#     # print(fig.data)
-print(regions_top2_df.index)
-
-for i, region in enumerate(regions_top2_df.index):
-    # get color for region
-    color = colors_set[i]
-    # filter df for region
-    # temp_df = pd.DataFrame(regions_top2_df.loc[region, :])
-
-    fig.add_trace(make_choro_trace(regions_top2_df, region, [[0, color], [1, color]]))
-fig.update_geos(scope='usa')
-
-# Colorscales: Blackbody,Bluered,Blues,Cividis,Earth,Electric,Greens,Greys,Hot,Jet,Picnic,Portland,Rainbow,RdBu,Reds,Viridis,YlGnBu,YlOrRd.
-# create buttons to filter between wet and dry
-# need list of dicts for buttons. Creates a button for each method setting that method's visibility to True
-# buttons = [dict(method='update', label=label, args=[{'visible':[j == i for j in range(0,5)]}]) for i, label in enumerate(methods_units.get_level_values(0))]
-
-# updatemenu = go.layout.Updatemenu(
-#     type="buttons",
-#     direction="right",
-#     showactive=True,
-#     x=0.8,
-#     y=1.1,
-#     buttons=buttons
-# )
-
-# fig.update_layout(
-#     updatemenus=[updatemenu],
-# )
-fig.update_traces(showscale=False) #Removes color bar
-fig.show()
-fig.write_html('chapter_maps/regional_map.html')
+def make_figure(context):
+    """
+    Builds the regional analysis chapter map
+    """
+    # colors for regions
+    colors_set = context.region_colors['RGB'].to_list()
+
+    # one polygon per region, dissolved from the counties once and cached
+    regions_geojson = context.regions(**region_geometry_settings)
+    regions_top2_df = load_regions_summary()
+
+    fig = go.Figure()
+
+    # make plots
+    # for i, df in enumerate(methods_dfs):
+    #     fig.add_trace(make_choro_trace(df, i))
+    #     # print(fig.data)
+
+    # get color for each region
+    region_colors = generateDiscreteColourScale([[color] for color in colors_set[:len(regions_top2_df)]])
+
+    fig.add_trace(make_choro_trace(regions_top2_df, regions_geojson, region_colors))
+    fig.update_geos(scope='usa')
+
+    # Colorscales: Blackbody,Bluered,Blues,Cividis,Earth,Electric,Greens,Greys,Hot,Jet,Picnic,Portland,Rainbow,RdBu,Reds,Viridis,YlGnBu,YlOrRd.
+    # create buttons to filter between wet and dry
+    # need list of dicts for buttons. Creates a button for each method setting that method's visibility to True
+    # buttons = [dict(method='update', label=label, args=[{'visible':[j == i for j in range(0,5)]}]) for i, label in enumerate(methods_units.get_level_values(0))]
+
+    # updatemenu = go.layout.Updatemenu(
+    #     type="buttons",
+    #     direction="right",
+    #     showactive=True,
+    #     x=0.8,
+    #     y=1.1,
+    #     buttons=buttons
+    # )
 
+    # fig.update_layout(
+    #     updatemenus=[updatemenu],
+    # )
+    fig.update_traces(showscale=False) #Removes color bar
+    return fig
 
+def build(context):
+    """
+    Writes the regional map to the output folder
+    """
+    fig = make_figure(context)
+    context.write_map(fig, output_name)
+    return fig
 
+if __name__ == '__main__':
+    fig = build(BuildContext())
+    fig.show()
@@ -1,36 +1,21 @@
-from xml.etree.ElementPath import prepare_self
-from requests import get
-import json
 import pandas as pd
-import numpy as np
-import math
-import seaborn as sns
-import plotly.express as px
 import plotly.graph_objects as go
-from dash import Dash, dcc, html, Input, Output
-import os
+from build_context import BuildContext
+from county_facts import select_facts
+from county_index import county_codes, geo_ids
+from dataset_catalog import read_dataset
+from figure_variants import colorbar_off_layout
+from geometry_prep import feature_subset
+from ranking import top_k
 
 # folder holding all forestry cdr data
 soils_path = 'data/Soils CDR'
 
-# data from census linking county name and fips
-county_fips_df = pd.read_csv('data/label_geography.csv', dtype={'geography':'str'})
-county_fips_df = county_fips_df[county_fips_df['geo_level']=='C']
-county_fips_df = county_fips_df.rename(columns={'label':'County, State', 'geography':'FIPS'})
+# name of the html file written to chapter_maps
+output_name = 'soils_map'
 
-def process_forestry_cdr(df):
-    """
-    Standardizes fips formatting for cdr dfs
-    
-    First Column must be FIPS column and last column must be CDR column
-    """
-    df = df.rename(columns={df.columns[0]:'FIPS',
-                           df.columns[-1]:'Total Tonnes CDR'})
-    df['FIPS'] = df['FIPS'].apply(lambda x: str(x).zfill(5))
-    # need to add '0500000US' to each GEOID so it matches th geo json file
-    df['GEO_ID'] = '0500000US' + df['FIPS']
-    df = df.merge(county_fips_df, on='FIPS')
-    return df[df['Total Tonnes CDR']>0]
+# simplification and rounding of the county polygons embedded in this map, see geometry_prep
+geometry_settings = {'resolution': '20m', 'tolerance': 0.005, 'decimals': 3}
 
 # Soils data is seperated into ifferent files for each of the 3 practices
 soils_cdr_path_dict = {'carbon_crop':'data/Soils CDR/EVcumulativeCDRbycounty_withcost.csv',
@@ -39,21 +24,10 @@ soils_cdr_path_dict = {'carbon_crop':'data/Soils CDR/EVcumulativeCDRbycounty_wit
                       }
 
 summary_soils_path = 'data/Soils CDR/Soils summary data Nov.csv'
-summary_df = pd.read_csv(summary_soils_path, dtype={'county_fips':str})
-summary_df['county_fips'] = summary_df['county_fips'].apply(lambda x: x.zfill(5))
-
-# merge with county state df
-summary_df = summary_df.merge(county_fips_df, left_on='county_fips', right_on='FIPS')
-# add this text so it matches geojson counties
-summary_df['GEO_ID'] = '0500000US' + summary_df['FIPS']
-
-# process data
-for practice in ['Carboncrop', 'Covercrop', 'FieldBorder']:
-    # Calculate CDR per land area per year
-    summary_df['CDR_per_ha_per_year_' + practice] = summary_df['CDR_per_year_' + practice] / summary_df['TotalCountyAreaHa']
-    # round price to the 10s place
-    summary_df['Cost_USD_per_Mg_CDR_' + practice] = summary_df['Cost_USD_per_Mg_CDR_' + practice].round(-1)
 
+# files this map is built from. The map is only rebuilt when one of these, or the code, changes
+inputs = [summary_soils_path,
+          'data/cb_2018_us_county_20m.zip']
 
 cdr_per_year_col = 'CDR per Year'
 cdr_per_area_col = 'CDR per Ha per Year'
@@ -72,139 +46,216 @@ summary_cols = {'CDR_per_year_Carboncrop': ('Carbon Crop', cdr_per_year_col),
                 'Combined_CDR_per_year_per_ha_cropland': ('All Practices', cdr_per_area_col)
                 }
 
-# protext county info in index
-summary_df = summary_df.set_index(['GEO_ID', 'County, State'])
-# keep only relevant columns
-summary_df = summary_df.loc[:, summary_cols.keys()]
-# convert columns to multiindex
-summary_df.columns = pd.MultiIndex.from_tuples(summary_cols.values())
-# convert to numeric
-summary_df = summary_df.apply(pd.to_numeric, errors='coerce')
-
-# get the top practice by cdr per ha per year
-idx = pd.IndexSlice
-summary_df[('All Practices', 'Top Practice')] = summary_df.loc[:, idx[['Carbon Crop', 'Cover Crop', 'Perennial Borders'], cdr_per_area_col]].idxmax(axis=1)
-# drop any row that didn't have a top practice
-summary_df = summary_df.dropna(subset=[('All Practices', 'Top Practice')])
-
-# take only the first entry from the tuple returned in idx max
-summary_df[('All Practices', 'Top Practice')] = summary_df[('All Practices', 'Top Practice')].apply(lambda x: x[0])
-print(summary_df.loc[:,idx['All Practices',:]].head())
+# columns read from the summary csv
+summary_source_cols = ['county_fips', 'TotalCountyAreaHa',
+                       *[f'{col}_{practice}' for practice in ['Carboncrop', 'Covercrop', 'FieldBorder'] for col in ['CDR_per_year', 'Cost_USD_per_Mg_CDR']],
+                       'Combined_CDR_per_year', 'Combined_CDR_per_year_per_ha_cropland']
 
 # Color Scheme for Soils Practices
 color_dict = {'Carbon Crop': ['#FFFFFF', "#eecf43"], #sns.diverging_palette('#FFFFFF', "#eecf43", n=n_colors).as_hex(),
-              'Perennial Borders': ['#FFFFFF', '#3182c1'], # sns.light_palette('#3182c1', n_colors).as_hex(), 
+              'Perennial Borders': ['#FFFFFF', '#3182c1'], # sns.light_palette('#3182c1', n_colors).as_hex(),
               'Cover Crop': ['#FFFFFF', '#59b375'], # sns.light_palette('#59b375', n_colors).as_hex()
             }
 
-# geo json file
-from urllib.request import urlopen
-with urlopen('https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json') as response:
-    counties = json.load(response)
-
-# make choropleth for soils map
-fig = go.Figure(go.Choropleth())
-fig.update_geos(scope='usa')
-
-# Convert to million tons
-#summary_df[('All Practices', 'CDR per Year')] = summary_df[('All Practices', 'CDR per Year')] /1000000
-
-# convert per area to 100 Ha
-summary_df[('All Practices', cdr_per_area_col)] = summary_df[('All Practices', cdr_per_area_col)] * 100
-summary_df[('All Practices', cdr_per_area_col)] = summary_df[('All Practices', cdr_per_area_col)].round(2)
-
-# Round all practicescdr per year for readability
-summary_df[('All Practices', cdr_per_year_col)] = summary_df[('All Practices', cdr_per_year_col)].round(-2)
-
-# create a trace for each practice
-for practice in ['Carbon Crop', 'Perennial Borders', 'Cover Crop']:
-    # filter for practice
-    df = summary_df.loc[summary_df[('All Practices', 'Top Practice')] == practice]
-    df = df.reset_index()
-    df = df.fillna(0)
-    df = df[df[('All Practices', cdr_per_year_col)] > 0]
-    print(f'95% cutoff Value {practice}:', df[('All Practices', cdr_per_area_col)].quantile(.95))
-    # create map
-    fig.add_trace(trace=go.Choropleth(
-        geojson=counties,
-        locationmode="geojson-id",
-        locations=df['GEO_ID'],
-        featureidkey='properties.GEO_ID',
-        # z=np.log10(df[('Cumulative', cdr_per_area_col)]),
-        z=df[(practice, cdr_per_area_col)] * 100,
-        zmax=df[(practice, cdr_per_area_col)].quantile(.95) * 100,
-        zmin=df[(practice, cdr_per_area_col)].min() * 100,
-        colorscale=color_dict.get(practice, 'reds'),
-        customdata=df[[('All Practices', 'Top Practice'), ('County, State', ''), 
-                       ('All Practices', cdr_per_year_col), ('All Practices', cdr_per_area_col), (practice, cdr_cost_col)]],
-        hovertemplate='<b>Top Practice per Area</b>: %{customdata[0]}<br>' +
-                        '<b>County</b>: %{customdata[1]}<br>' +
-                        '<b>All Practices CDR Potential</b>: %{customdata[2]:,.0f} Tonnes CO<sub>2</sub> per Year<br>' +
-                        '<b>All Practices CDR per Area</b>: %{customdata[3]:,.2f} Tonnes CO<sub>2</sub> per 100 Hectares per Year<br>' +
-                        f'<b>{practice} Cost</b>: ' + '$%{customdata[4]:,.0f} per Tonne CO<sub>2</sub><br>' +
-                        '<extra></extra>'))
-    
-    # Get rid of color bar. All color bars overlap right now, so it looks neater without them
-    # fig.update_traces(showscale=False)
-    
-fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
-
-fontsize=10
-# assign each trace to new color axis
-for i, trace in enumerate(fig.data, 1):
-    trace.update(coloraxis=f"coloraxis{i}")
-
 cbar_title_units = 'CO<sub>2</sub> Removal Potential Over Total County Area<br>Tonnes CO<sub>2</sub> per 100 Hectares per Year'
 
-# Add color scales
-fig.update_layout(
-    coloraxis1={"colorbar": {"x": -0.2, "len": 0.5, "y": 0.8}},
-    coloraxis2={
-        "colorbar": {
-            "x": 0.2,
-            "len": 0.2,
-            "y": -0.3,
-            'title':'Carbon Cropping<br>' + cbar_title_units,
-            'orientation':'h',
-            'titlefont':{'size':fontsize},
-            'tickfont':{'size':fontsize}},
-        "colorscale":color_dict.get('Carbon Crop'),
-        'cmax':summary_df[('Carbon Crop', cdr_per_area_col)].quantile(0.98) * 100,
-        'cmin': 0
-    },
-    coloraxis3={
-        "colorbar": {"x": 0.5, 
-                     "len": 0.2, 
-                     "y": -.3, 
-                     'title':'Perennial Borders<br>' + cbar_title_units,
-                     'orientation':'h',
-                     'titlefont':{'size':fontsize},
-                     'tickfont':{'size':fontsize}},
-        "colorscale":color_dict.get('Perennial Borders', 'Viridis'),
-        'cmax': summary_df[('Perennial Borders', cdr_per_area_col)].quantile(0.98) * 100,
-        'cmin': 0
-    },
-    coloraxis4={
-        "colorbar": {"x": 0.8, 
-                     "len": 0.2, 
-                     "y": -.3,
-                     'title':'Cover Crop<br>' + cbar_title_units,
-                     'orientation':'h',
-                     'titlefont':{'size':fontsize},
-                     'tickfont':{'size':fontsize}},
-        "colorscale": color_dict.get('Cover Crop', 'Viridis'),
-        'cmax': summary_df[('Cover Crop', cdr_per_area_col)].quantile(0.98) * 100,
-        'cmin': 0
-            })
-
-fig.update_coloraxes(colorbar_title_side='top')
-fig.write_html('chapter_maps/soils_map.html')
-
-for i in range(len(fig.data)):
-    fig.update_layout({f'coloraxis{i+1}':{'showscale':False}})
-
-fig.show()
-fig.write_html('chapter_maps/soils_map_nocbar.html')
+# color bar title of each practice
+practice_titles = {'Carbon Crop': 'Carbon Cropping', 'Perennial Borders': 'Perennial Borders', 'Cover Crop': 'Cover Crop'}
+
+# metrics the map app can switch between. Label: (column, scale, color bar units). The first is the one drawn by make_figure
+view_metrics = {'CDR per Area': (cdr_per_area_col, 100, cbar_title_units),
+                'CDR per Year': (cdr_per_year_col, 1, 'CO<sub>2</sub> Removal Potential<br>Tonnes CO<sub>2</sub> per Year'),
+                'Cost': (cdr_cost_col, 1, 'Cost<br>USD per Tonne CO<sub>2</sub>')}
+
+def fact_name(label):
+    """
+    Takes a (practice, metric) label and returns its county fact table column, e.g. soils_cover_crop_cdr_per_year
+    """
+    return 'soils_' + '_'.join(part.lower().replace(' ', '_') for part in label)
+
+# columns this map adds to the county fact table, (practice, metric): fact column
+fact_columns = {label: fact_name(label) for label in [*summary_cols.values(), ('All Practices', 'Top Practice')]}
+
+def read_facts():
+    """
+    Reads the soils summary data and returns its (practice, metric) columns and the top practice by county code
+    """
+    summary_df = read_dataset(summary_soils_path, columns=summary_source_cols, dtype={'county_fips':str})
+    summary_df['county_code'] = county_codes(summary_df['county_fips'])
+
+    # process data
+    for practice in ['Carboncrop', 'Covercrop', 'FieldBorder']:
+        # Calculate CDR per land area per year
+        summary_df['CDR_per_ha_per_year_' + practice] = summary_df['CDR_per_year_' + practice] / summary_df['TotalCountyAreaHa']
+        # round price to the 10s place
+        summary_df['Cost_USD_per_Mg_CDR_' + practice] = summary_df['Cost_USD_per_Mg_CDR_' + practice].round(-1)
+
+    # protext county info in index
+    summary_df = summary_df.set_index('county_code')
+    # keep only relevant columns, named by (practice, metric)
+    summary_df = summary_df.loc[:, summary_cols.keys()].rename(columns=summary_cols)
+    # convert to numeric
+    summary_df = summary_df.apply(pd.to_numeric, errors='coerce')
+
+    # get the top practice by cdr per ha per year, ranking on practice names only
+    practice_df = summary_df[[(practice, cdr_per_area_col) for practice in ['Carbon Crop', 'Cover Crop', 'Perennial Borders']]]
+    practice_df.columns = [practice for practice, _ in practice_df.columns]
+    summary_df[('All Practices', 'Top Practice')] = top_k(practice_df, k=1)['method1'].to_numpy()
+    return summary_df.reset_index()
+
+def load_soils(context):
+    """
+    Returns the soils columns of the county fact table with (practice, metric) multiindex columns, for the
+    counties with a top practice
+    """
+    summary_df = select_facts(context.county_facts, fact_columns, required=fact_columns[('All Practices', 'Top Practice')])
+    # protext county info in index
+    summary_df = summary_df.set_index(['county_code', 'County, State'])
+    # convert columns to multiindex
+    summary_df.columns = pd.MultiIndex.from_tuples(summary_df.columns)
+    return summary_df
+
+def practice_frames(summary_df):
+    """
+    Takes the soils summary df and returns it with the All Practices columns rounded for display, plus a dict of
+    practice to the counties where it is the top practice. Each practice is one trace of the map
+    """
+    summary_df = summary_df.copy()
+    # Convert to million tons
+    #summary_df[('All Practices', 'CDR per Year')] = summary_df[('All Practices', 'CDR per Year')] /1000000
+
+    # convert per area to 100 Ha
+    summary_df[('All Practices', cdr_per_area_col)] = summary_df[('All Practices', cdr_per_area_col)] * 100
+    summary_df[('All Practices', cdr_per_area_col)] = summary_df[('All Practices', cdr_per_area_col)].round(2)
+
+    # Round all practicescdr per year for readability
+    summary_df[('All Practices', cdr_per_year_col)] = summary_df[('All Practices', cdr_per_year_col)].round(-2)
+
+    practice_dfs = {}
+    for practice in ['Carbon Crop', 'Perennial Borders', 'Cover Crop']:
+        # filter for practice
+        df = summary_df.loc[summary_df[('All Practices', 'Top Practice')] == practice]
+        df = df.reset_index()
+        df = df.fillna(0)
+        practice_dfs[practice] = df[df[('All Practices', cdr_per_year_col)] > 0]
+    return summary_df, practice_dfs
+
+def views(context):
+    """
+    Returns the metrics the map app can switch between, as new z values per trace and color axis ranges and titles
+    """
+    summary_df, practice_dfs = practice_frames(load_soils(context))
+    views = {}
+    for label, (col, scale, units) in view_metrics.items():
+        data, layout = {}, {}
+        # trace 0 is the empty choropleth, so practices start at trace 1 and color axis 2
+        for i, (practice, df) in enumerate(practice_dfs.items(), 1):
+            data[i] = {'z': (df[(practice, col)] * scale).tolist()}
+            layout[(f'coloraxis{i + 1}', 'cmax')] = summary_df[(practice, col)].quantile(0.98) * scale
+            layout[(f'coloraxis{i + 1}', 'colorbar', 'title', 'text')] = f'{practice_titles[practice]}<br>{units}'
+        views[label] = {'data': data, 'layout': layout}
+    return views
+
+def make_figure(context):
+    """
+    Builds the soils chapter map
+    """
+    summary_df, practice_dfs = practice_frames(load_soils(context))
+
+    # geo json file. Built from the bundled census shapefile and cached locally
+    counties = context.counties(**geometry_settings)
+
+    # make choropleth for soils map
+    fig = go.Figure(go.Choropleth())
+    fig.update_geos(scope='usa')
+
+    # create a trace for each practice
+    for practice, df in practice_dfs.items():
+        # add this text so it matches geojson counties
+        locations = geo_ids(df[('county_code', '')])
+        # create map. Each trace only embeds the counties it colors
+        fig.add_trace(trace=go.Choropleth(
+            geojson=feature_subset(counties, locations, 'properties.GEO_ID'),
+            locationmode="geojson-id",
+            locations=locations,
+            featureidkey='properties.GEO_ID',
+            # z=np.log10(df[('Cumulative', cdr_per_area_col)]),
+            z=df[(practice, cdr_per_area_col)] * 100,
+            zmax=df[(practice, cdr_per_area_col)].quantile(.95) * 100,
+            zmin=df[(practice, cdr_per_area_col)].min() * 100,
+            colorscale=color_dict.get(practice, 'reds'),
+            customdata=df[[('All Practices', 'Top Practice'), ('County, State', ''),
+                           ('All Practices', cdr_per_year_col), ('All Practices', cdr_per_area_col), (practice, cdr_cost_col)]],
+            hovertemplate='<b>Top Practice per Area</b>: %{customdata[0]}<br>' +
+                            '<b>County</b>: %{customdata[1]}<br>' +
+                            '<b>All Practices CDR Potential</b>: %{customdata[2]:,.0f} Tonnes CO<sub>2</sub> per Year<br>' +
+                            '<b>All Practices CDR per Area</b>: %{customdata[3]:,.2f} Tonnes CO<sub>2</sub> per 100 Hectares per Year<br>' +
+                            f'<b>{practice} Cost</b>: ' + '$%{customdata[4]:,.0f} per Tonne CO<sub>2</sub><br>' +
+                            '<extra></extra>'))
+
+        # Get rid of color bar. All color bars overlap right now, so it looks neater without them
+        # fig.update_traces(showscale=False)
 
+    fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
 
+    fontsize=10
+    # assign each trace to new color axis
+    for i, trace in enumerate(fig.data, 1):
+        trace.update(coloraxis=f"coloraxis{i}")
+
+    # Add color scales
+    fig.update_layout(
+        coloraxis1={"colorbar": {"x": -0.2, "len": 0.5, "y": 0.8}},
+        coloraxis2={
+            "colorbar": {
+                "x": 0.2,
+                "len": 0.2,
+                "y": -0.3,
+                'title':'Carbon Cropping<br>' + cbar_title_units,
+                'orientation':'h',
+                'titlefont':{'size':fontsize},
+                'tickfont':{'size':fontsize}},
+            "colorscale":color_dict.get('Carbon Crop'),
+            'cmax':summary_df[('Carbon Crop', cdr_per_area_col)].quantile(0.98) * 100,
+            'cmin': 0
+        },
+        coloraxis3={
+            "colorbar": {"x": 0.5,
+                         "len": 0.2,
+                         "y": -.3,
+                         'title':'Perennial Borders<br>' + cbar_title_units,
+                         'orientation':'h',
+                         'titlefont':{'size':fontsize},
+                         'tickfont':{'size':fontsize}},
+            "colorscale":color_dict.get('Perennial Borders', 'Viridis'),
+            'cmax': summary_df[('Perennial Borders', cdr_per_area_col)].quantile(0.98) * 100,
+            'cmin': 0
+        },
+        coloraxis4={
+            "colorbar": {"x": 0.8,
+                         "len": 0.2,
+                         "y": -.3,
+                         'title':'Cover Crop<br>' + cbar_title_units,
+                         'orientation':'h',
+                         'titlefont':{'size':fontsize},
+                         'tickfont':{'size':fontsize}},
+            "colorscale": color_dict.get('Cover Crop', 'Viridis'),
+            'cmax': summary_df[('Cover Crop', cdr_per_area_col)].quantile(0.98) * 100,
+            'cmin': 0
+                })
+
+    fig.update_coloraxes(colorbar_title_side='top')
+    return fig
+
+def build(context):
+    """
+    Writes the soils map and its no color bar version to the output folder
+    """
+    fig = make_figure(context)
+    # save version with no cbar. Only the layout differs, so it shares the figure data with the main map
+    context.write_map(fig, output_name, variants={'nocbar': colorbar_off_layout(fig)})
+    return fig
 
+if __name__ == '__main__':
+    fig = build(BuildContext())
+    fig.show()
@@ -0,0 +1,167 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from base_map import base_map_settings, load_base_map
+from build_all import build_in_pool, failed_maps, map_modules, try_build_map
+from build_cache import write_atomically
+from build_context import BuildContext
+from build_profile import stage
+from figure_variants import merge_layout
+from network_layers import add_network_layers, network_layers
+
+# Static PNG, SVG and PDF versions of every chapter map and its layout variants (the _nocbar maps), for the print
+# report. The maps are built exactly as for the html, by their own build functions, with a context whose
+# write_map renders images with kaleido instead of writing html.
+# Each process starts one kaleido process the first time it exports a figure and reuses it for every figure after,
+# and the maps are spread over a process pool like build_all. Nothing is fetched from the network: plotly.js comes
+# from the plotly package, MathJax is off and the base map topojson is built from the bundled counties (base_map).
+# Exporting needs the optional kaleido package
+
+# default size of the exported maps on the page, width and height in inches. Plotly lays figures out in css
+# pixels, 96 to the inch
+page_size = (6.5, 4.0)
+css_dpi = 96
+
+export_formats = ['png', 'svg', 'pdf']
+# resolutions the png files are exported at. svg and pdf are vector and exported once
+default_dpis = [150, 300]
+
+# kaleido scope of this process, started by the first export and reused by every export after it
+_scope = None
+
+def image_scope(topojson_dir):
+    """
+    Returns this process's kaleido scope, creating it the first time, set up to run without network
+    """
+    global _scope
+    if _scope is None:
+        import plotly
+        from kaleido.scopes.plotly import PlotlyScope
+        plotlyjs = os.path.join(os.path.dirname(plotly.__file__), 'package_data', 'plotly.min.js')
+        # plotly.js asks for topojson_name.json under this url
+        _scope = PlotlyScope(plotlyjs=plotlyjs, mathjax=False, topojson=f'{Path(topojson_dir).absolute().as_uri()}/')
+    return _scope
+
+class StaticExportContext(BuildContext):
+    """
+    BuildContext whose write_map exports each map and its layout variants as static images instead of html
+
+    formats is a list of 'png', 'svg' and 'pdf', and every png is exported once per resolution in dpis.
+    size is the width and height of the maps on the page in inches. topojson_dir is a folder with plotly's own
+    base map topojson files, when the one built by base_map won't do
+    """
+    def __init__(self, output_dir='print_maps', layers=(), formats=export_formats, dpis=default_dpis, size=page_size,
+                 topojson_dir=None):
+        super().__init__(output_dir=output_dir, layers=layers)
+        self.formats = list(formats)
+        self.dpis = list(dpis)
+        self.size = tuple(size)
+        self.topojson_dir = topojson_dir
+
+    def base_map_dir(self):
+        """
+        Folder plotly reads the base map topojson from
+        """
+        if self.topojson_dir is None:
+            self.topojson_dir = load_base_map(**base_map_settings)
+        return self.topojson_dir
+
+    def warm(self, *args, **kwargs):
+        # the base map is built once here rather than by every worker
+        self.base_map_dir()
+        return super().warm(*args, **kwargs)
+
+    def images(self, name):
+        """
+        Returns (format, scale, file name) for every image exported of the map or variant name
+        """
+        images = []
+        for format in self.formats:
+            if format == 'png':
+                images += [('png', dpi / css_dpi, f'{name}_{dpi}dpi.png') for dpi in self.dpis]
+            else:
+                images.append((format, 1, f'{name}.{format}'))
+        return images
+
+    def write_map(self, fig, name, variants=None):
+        """
+        Exports fig as name_<dpi>dpi.png, name.svg and name.pdf, and the same for each layout variant, e.g.
+        name_nocbar.svg. Any network layers of this context are drawn on top first
+        """
+        if self.layers:
+            add_network_layers(fig, self.networks())
+        with stage('serialize'):
+            figure = fig.to_dict()
+        scope = image_scope(self.base_map_dir())
+        width, height = (inches * css_dpi for inches in self.size)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        for suffix, layout_patch in {'': {}, **(variants or {})}.items():
+            variant = {**figure, 'layout': merge_layout(dict(figure['layout']), layout_patch)}
+            for format, scale, file_name in self.images(f'{name}_{suffix}' if suffix else name):
+                with stage('export'):
+                    image = scope.transform(variant, format=format, width=width, height=height, scale=scale)
+
+                def write(path):
+                    with open(path, 'wb') as f:
+                        f.write(image)
+                with stage('write'):
+                    write_atomically(os.path.join(self.output_dir, file_name), write)
+
+def export_all(context=None, maps=None, workers=1):
+    """
+    Exports every chapter map, or just maps, as static images and returns a dict of map module to its build report
+
+    With workers > 1 the maps are exported in a process pool, each worker keeping its own kaleido process.
+    A map that fails is reported with its error and the others are still exported
+    """
+    context = context or StaticExportContext()
+    reports = {}
+
+    def finished(name, report):
+        reports[name] = report
+        if 'error' in report:
+            print(f'{name}: failed after {report["seconds"]:.1f}s\n{report["traceback"]}')
+            return
+        print(f'{name}: {report["seconds"]:.1f}s')
+
+    if workers <= 1:
+        for name in maps or map_modules:
+            finished(name, try_build_map(name, context))
+    else:
+        build_in_pool(context, dict.fromkeys(maps or map_modules), workers, False, None, finished)
+    return reports
+
+def main():
+    parser = argparse.ArgumentParser(description='Export all chapter maps as static images for print')
+    parser.add_argument('maps', nargs='*', help=f'only export these maps, any of: {", ".join(map_modules)}')
+    parser.add_argument('--output-dir', default='print_maps', help='folder the images are written to')
+    parser.add_argument('--formats', nargs='+', choices=export_formats, default=export_formats,
+                        help='image formats to export')
+    parser.add_argument('--dpi', nargs='+', type=int, default=default_dpis, help='resolutions to export the png files at')
+    parser.add_argument('--page-size', nargs=2, type=float, default=page_size, metavar=('WIDTH', 'HEIGHT'),
+                        help='size of the maps on the page in inches')
+    parser.add_argument('--layers', nargs='+', choices=list(network_layers), default=[],
+                        help='draw these pipeline, road, waterway or transloading networks over every map')
+    parser.add_argument('--topojson', help="folder with plotly's base map topojson files, instead of building one from the counties")
+    parser.add_argument('--workers', type=int, default=1, nargs='?', const=os.cpu_count(),
+                        help='export maps in parallel with this many processes. Defaults to one per cpu if no number is given')
+    args = parser.parse_args()
+    unknown = set(args.maps) - set(map_modules)
+    if unknown:
+        parser.error(f'unknown maps: {", ".join(sorted(unknown))}')
+
+    start = time.perf_counter()
+    context = StaticExportContext(output_dir=args.output_dir, layers=args.layers, formats=args.formats,
+                                  dpis=args.dpi, size=args.page_size, topojson_dir=args.topojson)
+    reports = export_all(context, args.maps, args.workers)
+    failed = failed_maps(reports)
+    print(f'Exported {len(reports) - len(failed)} maps to {args.output_dir} in {time.perf_counter() - start:.1f}s')
+    for name in failed:
+        print(f'Failed: {name}: {reports[name]["error"]}')
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
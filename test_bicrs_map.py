@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+from bicrs_map import cdr_col, cost_col, load_bicrs, scenario_frames, scenario_labels
+
+summary_path = 'data/BiCRS CDR/20231205 Regional Summary.xlsx'
+
+# sheet each scenario is read from
+scenario_sheets = {'Total Biomass': 'Regional cost and CDR Wet + Dry',
+                   'Wet Biomass Waste': 'Regional cost and CDR Wet only',
+                   'Low Moisture Biomass': 'Regional cost CDR Dry only'}
+
+@pytest.fixture(scope='module')
+def frames():
+    bicrs_wet_df, bicrs_dry_df, bicrs_both_df, _ = load_bicrs()
+    return scenario_frames(bicrs_wet_df, bicrs_dry_df, bicrs_both_df)
+
+@pytest.mark.parametrize('label', scenario_labels)
+def test_region_totals_match_sheet(frames, label):
+    # the totals are on the one row of each region that has them
+    sheet_df = pd.read_excel(summary_path, sheet_name=scenario_sheets[label])
+    totals = sheet_df.dropna(subset=[cdr_col]).set_index('Region')[[cdr_col, cost_col]]
+    df = frames[label].set_index('Region')[[cdr_col, cost_col]]
+    assert len(df) == len(totals)
+    pd.testing.assert_frame_equal(df.loc[totals.index], totals, check_names=False)
+
+def test_east_cascades_total(frames):
+    df = frames['Total Biomass'].set_index('Region')
+    assert df.loc['East Cascades', cdr_col] == pytest.approx(11.64, abs=0.01)
+    assert df.loc['Western Cities', cdr_col] == pytest.approx(8.87, abs=0.01)
+
+def test_scenarios_share_region_order(frames):
+    regions = frames[scenario_labels[0]]['Region'].tolist()
+    for label in scenario_labels[1:]:
+        assert frames[label]['Region'].tolist() == regions
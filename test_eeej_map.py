@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+from county_index import county_codes
+from eeej_map import methods_paths, read_facts
+
+csv_path = 'data/EEEJ/percentile_ranking_all_methods.csv'
+
+@pytest.fixture(scope='module')
+def csv_df():
+    df = pd.read_csv(csv_path, dtype={'GEOID': str})
+    df['county_code'] = county_codes(df['GEOID'])
+    # the csv names DACS 'DAC'
+    df['Highest CDR Method'] = df['Highest CDR Method'].replace({'DAC': 'DACS'})
+    return df.drop_duplicates(subset='county_code').set_index('county_code')
+
+@pytest.fixture(scope='module')
+def facts_df():
+    return read_facts().drop_duplicates(subset='county_code').set_index('county_code')
+
+def test_every_csv_county_is_mapped(csv_df, facts_df):
+    assert set(facts_df.index) == set(csv_df.index)
+
+def test_highest_method_matches_csv(csv_df, facts_df):
+    facts_df = facts_df.loc[csv_df.index]
+    pd.testing.assert_series_equal(facts_df['Highest CDR Method'], csv_df['Highest CDR Method'], check_dtype=False)
+    pd.testing.assert_series_equal(facts_df['Max EEEJ weighted CDR score'], csv_df['Max EEEJ weighted CDR score'],
+                                   check_dtype=False)
+
+@pytest.mark.parametrize('method', list(methods_paths))
+def test_method_scores_match_csv(csv_df, facts_df, method):
+    csv_col = f'EEEJ weighted CDR score_{method.replace("DACS", "DAC")}'
+    pd.testing.assert_series_equal(facts_df.loc[csv_df.index, f'{method} EEEJ weighted CDR score'], csv_df[csv_col],
+                                   check_dtype=False, check_names=False)
@@ -0,0 +1,253 @@
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.colors import get_colorscale, sample_colorscale
+from basalt_geometry import basalt_zip_path, load_basalt_gdf
+from build_context import BuildContext
+from county_index import county_codes
+from region_geometry import load_regions_gdf
+from lazy_imports import lazy_module
+
+shapely = lazy_module('shapely')
+
+# Cuts the county, region and basalt polygons, with the per county metrics of the chapter maps, into a z/x/y
+# pyramid of Mapbox Vector Tiles, or one .mbtiles file. A map built on the tiles only downloads the tiles in view
+# at the detail the zoom needs, so finer boundaries no longer mean bigger html files.
+# Encoding needs the optional mapbox_vector_tile package. Everything else runs offline from the bundled data
+
+# tile coordinates run from 0 to tile_extent, and features are cut with a small buffer so polygons meet at tile edges
+tile_extent = 4096
+tile_buffer = 64
+# half the width of the web mercator world in meters
+mercator_half_width = 20037508.342789244
+
+# metrics drawn by the tile view, property: (title, colorscale)
+view_metrics = {'forest_cdr': ('Forestry CDR Potential by 2050 (Tonnes CO<sub>2</sub>)', 'Greens'),
+                'soils_cdr_per_ha': ('Soils CDR per Hectare per Year (Tonnes CO<sub>2</sub>)', 'YlOrBr'),
+                'storage_cost': ('Geologic Storage Cost (USD per Tonne CO<sub>2</sub>)', 'Greens_r'),
+                'dac_capacity': ('Adsorbent DACS Capacity (Million Tonnes CO<sub>2</sub> per Year)', 'Blues'),
+                'eeej_score': ('Equity Weighted CDR Score', 'Purples')}
+# the tile view colors each metric in this many quantile classes, each its own tile layer
+n_classes = 5
+
+def county_metrics(context):
+    """
+    Returns one row per county with the headline metric of every county level chapter map, keyed by county_code
+    """
+    facts_df = context.county_facts
+    metrics_df = facts_df[['county_code', 'County, State', 'soils_all_practices_cdr_per_ha_per_year',
+                           'soils_all_practices_top_practice', 'storage_cost', 'dac_capacity', 'dac_cost',
+                           'eeej_score', 'eeej_method']].rename(
+        columns={'County, State': 'name', 'soils_all_practices_cdr_per_ha_per_year': 'soils_cdr_per_ha',
+                 'soils_all_practices_top_practice': 'soils_top'})
+    # a county can be in more than one forest region
+    metrics_df.insert(2, 'forest_cdr', facts_df.filter(like='forest_cdr_').sum(axis=1, min_count=1))
+    # text properties are written to the tiles as plain strings
+    for column in ['soils_top', 'eeej_method']:
+        metrics_df[column] = metrics_df[column].astype(object)
+    return metrics_df
+
+def metric_classes(values, n=n_classes):
+    """
+    Takes a metric series and returns its quantile class (0 to n-1, -1 when missing) and the class edges
+    """
+    edges = np.unique(np.nanquantile(values.to_numpy(dtype=float), np.linspace(0, 1, n + 1)))
+    classes = np.searchsorted(edges[1:-1], values.to_numpy(dtype=float), side='right')
+    return np.where(values.isna(), -1, classes), edges
+
+def tile_layers(context, resolution='5m'):
+    """
+    Returns a dict of tile layer name to a web mercator GeoDataFrame
+
+    counties carries every metric as properties, regions and basalt the polygons, and <metric>_<class> holds the
+    counties of one class of a view metric, for the tile view
+    """
+    counties_gdf = context.counties_gdf(resolution)
+    counties_gdf['county_code'] = county_codes(counties_gdf['GEOID'])
+    counties_gdf = counties_gdf.merge(county_metrics(context), on='county_code', how='left')
+    counties_gdf = counties_gdf.drop(columns=['GEO_ID', 'STATEFP', 'NAME', 'county_code'])
+
+    layers = {'counties': counties_gdf,
+              'regions': load_regions_gdf(resolution, context.region_mapping).reset_index()[['Region', 'geometry']]}
+    if os.path.exists(basalt_zip_path):
+        layers['basalt'] = load_basalt_gdf()[['geometry']]
+
+    for metric in view_metrics:
+        classes, edges = metric_classes(counties_gdf[metric])
+        for i in range(len(edges) - 1):
+            layers[f'{metric}_{i}'] = counties_gdf.loc[classes == i, ['GEOID', 'geometry']]
+
+    # clip to the latitudes web mercator can show
+    world = shapely.box(-180, -85.05, 180, 85.05)
+    return {name: gdf.to_crs('WGS84').clip(world).to_crs('EPSG:3857') for name, gdf in layers.items()}
+
+def tile_bounds(z, x, y):
+    """
+    Returns the web mercator bounds (minx, miny, maxx, maxy) of tile z/x/y
+    """
+    size = 2 * mercator_half_width / 2 ** z
+    minx = -mercator_half_width + x * size
+    maxy = mercator_half_width - y * size
+    return minx, maxy - size, minx + size, maxy
+
+def covering_tiles(gdf, z):
+    """
+    Returns the set of (x, y) tiles at zoom z that the features of a web mercator GeoDataFrame touch
+    """
+    n = 2 ** z
+    size = 2 * mercator_half_width / n
+    bounds = gdf.geometry.bounds.to_numpy()
+    x0 = np.clip(((bounds[:, 0] + mercator_half_width) // size).astype(int), 0, n - 1)
+    x1 = np.clip(((bounds[:, 2] + mercator_half_width) // size).astype(int), 0, n - 1)
+    y0 = np.clip(((mercator_half_width - bounds[:, 3]) // size).astype(int), 0, n - 1)
+    y1 = np.clip(((mercator_half_width - bounds[:, 1]) // size).astype(int), 0, n - 1)
+    tiles = set()
+    for a, b, c, d in zip(x0, x1, y0, y1):
+        tiles.update((x, y) for x in range(a, b + 1) for y in range(c, d + 1))
+    return tiles
+
+def tile_features(gdf, bounds):
+    """
+    Cuts the features of a GeoDataFrame to one tile, simplified for the tile's resolution, in tile coordinates
+    """
+    minx, miny, maxx, maxy = bounds
+    scale = tile_extent / (maxx - minx)
+    pad = tile_buffer / scale
+    candidates = gdf.iloc[gdf.sindex.query(shapely.box(minx - pad, miny - pad, maxx + pad, maxy + pad))]
+    if candidates.empty:
+        return []
+
+    geoms = shapely.clip_by_rect(candidates.geometry.to_numpy(), minx - pad, miny - pad, maxx + pad, maxy + pad)
+    # one tile unit is the finest detail a tile can show
+    geoms = shapely.simplify(geoms, 1 / scale, preserve_topology=True)
+    geoms = shapely.transform(geoms, lambda coords: np.round((coords - [minx, miny]) * scale))
+    properties = candidates.drop(columns='geometry').to_dict('records')
+    return [{'geometry': geom, 'properties': {key: value for key, value in props.items() if pd.notna(value)}}
+            for geom, props in zip(geoms, properties) if not shapely.is_empty(geom)]
+
+def encode_tile(layers, z, x, y):
+    """
+    Returns the encoded vector tile z/x/y of the given layers, or None if no layer has a feature in it
+    """
+    import mapbox_vector_tile
+
+    bounds = tile_bounds(z, x, y)
+    tile = []
+    for name, gdf in layers.items():
+        features = tile_features(gdf, bounds)
+        if features:
+            tile.append({'name': name, 'features': features})
+    if not tile:
+        return None
+    return mapbox_vector_tile.encode(tile)
+
+def tilejson(layers, min_zoom, max_zoom, tiles_url):
+    """
+    Returns the TileJSON description of the tileset, listing every layer and its fields
+    """
+    vector_layers = [{'id': name, 'fields': {column: str(gdf[column].dtype) for column in gdf.columns if column != 'geometry'}}
+                     for name, gdf in layers.items()]
+    return {'tilejson': '2.2.0', 'name': 'cdr_maps', 'format': 'pbf', 'scheme': 'xyz', 'tiles': [tiles_url],
+            'minzoom': min_zoom, 'maxzoom': max_zoom, 'bounds': [-180, -85.05, 180, 85.05],
+            'vector_layers': vector_layers}
+
+def export_tiles(layers, output_dir, min_zoom=2, max_zoom=8, mbtiles_path=None):
+    """
+    Writes every non empty tile from min_zoom to max_zoom to output_dir/z/x/y.pbf, or into one mbtiles file
+
+    Tiles in mbtiles are gzipped as MBTiles readers expect. Loose .pbf files are left uncompressed so a plain
+    static file server can hand them to the browser as they are. Returns the number of tiles written
+    """
+    if mbtiles_path:
+        if os.path.exists(mbtiles_path):
+            os.remove(mbtiles_path)
+        db = sqlite3.connect(mbtiles_path)
+        db.execute('CREATE TABLE metadata (name text, value text)')
+        db.execute('CREATE TABLE tiles (zoom_level integer, tile_column integer, tile_row integer, tile_data blob)')
+        db.execute('CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)')
+        description = tilejson(layers, min_zoom, max_zoom, '')
+        metadata = {'name': 'cdr_maps', 'format': 'pbf', 'minzoom': min_zoom, 'maxzoom': max_zoom,
+                    'bounds': ','.join(map(str, description['bounds'])),
+                    'json': json.dumps({'vector_layers': description['vector_layers']})}
+        db.executemany('INSERT INTO metadata VALUES (?, ?)', [(key, str(value)) for key, value in metadata.items()])
+    else:
+        with open(os.path.join(output_dir, 'tiles.json'), 'w') as f:
+            json.dump(tilejson(layers, min_zoom, max_zoom, '{z}/{x}/{y}.pbf'), f, indent=1)
+
+    count = 0
+    for z in range(min_zoom, max_zoom + 1):
+        tiles = set().union(*[covering_tiles(gdf, z) for gdf in layers.values() if not gdf.empty])
+        for x, y in sorted(tiles):
+            data = encode_tile(layers, z, x, y)
+            if data is None:
+                continue
+            if mbtiles_path:
+                # mbtiles rows count up from the bottom
+                db.execute('INSERT INTO tiles VALUES (?, ?, ?, ?)', (z, x, 2 ** z - 1 - y, gzip.compress(data)))
+            else:
+                os.makedirs(os.path.join(output_dir, str(z), str(x)), exist_ok=True)
+                with open(os.path.join(output_dir, str(z), str(x), f'{y}.pbf'), 'wb') as f:
+                    f.write(data)
+            count += 1
+        print(f'zoom {z}: {len(tiles)} tiles')
+
+    if mbtiles_path:
+        db.commit()
+        db.close()
+    return count
+
+def tile_figure(metric, edges, tiles_url):
+    """
+    Builds a map of one metric drawn from the vector tiles instead of embedded geojson
+
+    Each class of the metric is a fill layer of the tile source, so the html holds no geometry at all
+    """
+    title, colorscale = view_metrics[metric]
+    # one evenly spaced color from the scale per class
+    class_colors = sample_colorscale(get_colorscale(colorscale), np.linspace(0, 1, len(edges) - 1))
+
+    layers = [{'sourcetype': 'vector', 'source': [tiles_url], 'sourcelayer': f'{metric}_{i}',
+               'type': 'fill', 'color': color, 'opacity': 0.9, 'below': 'traces'}
+              for i, color in enumerate(class_colors)]
+    layers.append({'sourcetype': 'vector', 'source': [tiles_url], 'sourcelayer': 'counties',
+                   'type': 'line', 'color': '#ffffff', 'line': {'width': 0.3}})
+
+    # one empty trace per class for the legend
+    fig = go.Figure([go.Scattermapbox(lon=[None], lat=[None], mode='markers', marker={'size': 10, 'color': color},
+                                      name=f'{edges[i]:,.2f} - {edges[i + 1]:,.2f}')
+                     for i, color in enumerate(class_colors)])
+    fig.update_layout(mapbox={'style': 'white-bg', 'layers': layers, 'center': {'lon': -96, 'lat': 38}, 'zoom': 3},
+                      legend={'title': {'text': title}},
+                      margin={"r":0,"t":0,"l":0,"b":0})
+    return fig
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the county, region and basalt layers as vector tiles')
+    parser.add_argument('--output-dir', default='chapter_maps', help='folder the tiles folder and tile maps are written to')
+    parser.add_argument('--resolution', default='5m', help='census county resolution to cut the tiles from')
+    parser.add_argument('--min-zoom', type=int, default=2)
+    parser.add_argument('--max-zoom', type=int, default=8)
+    parser.add_argument('--mbtiles', help='write one .mbtiles file here instead of a z/x/y folder of tiles')
+    args = parser.parse_args()
+
+    context = BuildContext(output_dir=args.output_dir)
+    layers = tile_layers(context, args.resolution)
+    tiles_dir = os.path.join(args.output_dir, 'tiles')
+    os.makedirs(tiles_dir, exist_ok=True)
+    count = export_tiles(layers, tiles_dir, args.min_zoom, args.max_zoom, args.mbtiles)
+    print(f'Wrote {count} tiles')
+
+    # tile maps read the z/x/y folder next to them
+    if not args.mbtiles:
+        counties_gdf = layers['counties']
+        for metric in view_metrics:
+            classes, edges = metric_classes(counties_gdf[metric])
+            context.write_map(tile_figure(metric, edges, 'tiles/{z}/{x}/{y}.pbf'), f'tiles_{metric}')
+
+if __name__ == '__main__':
+    main()